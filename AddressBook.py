@@ -3,6 +3,17 @@ from tkinter import *
 import sqlite3
 import os
 import re
+import threading
+import queue
+import itertools
+import contextlib
+import functools
+import inspect
+import logging
+import time
+import bisect
+import heapq
+from collections import OrderedDict, namedtuple, deque
 
 ###################################Contact Class####################################################
 # Exceptions to check inputs when creating a contact
@@ -13,13 +24,66 @@ class InvalidContactEmailException(Exception):
 class InvalidContactAddressException(Exception):
     pass
 
+# Rules for the contact fields, used by the Contact setters and by ValidateColumns.
+# A field is valid if it is empty or if the whole value matches its rule; no rule matches a line break.
+# phone number: 10 digits, area code included
+PHONE_RULE = r'\d{10}'
+# e-mail address: something@domain.tld
+EMAIL_RULE = r'[^@\n]+@[^@\n]+\.[^@\n]+[^\n]*'
+# zip code: 5 digits, only checked once the whole address is filled in
+ZIP_RULE = r'\d{5}'
+PHONE_PATTERN = re.compile(PHONE_RULE)
+EMAIL_PATTERN = re.compile(EMAIL_RULE)
+ZIP_CODE_PATTERN = re.compile(ZIP_RULE)
+NON_DIGIT_PATTERN = re.compile(r'\D')
+
+def ValidPhone(phone):
+    return not phone or PHONE_PATTERN.fullmatch(str(phone)) is not None
+
+def ValidEmail(email):
+    return not email or EMAIL_PATTERN.fullmatch(str(email)) is not None
+
+def ValidAddress(address_info):
+    # an address missing any field is accepted as is
+    return not all(address_info) or ZIP_CODE_PATTERN.fullmatch(str(address_info[3])) is not None
+
+def NormalizePhone(phone):
+    '''Returns the E.164 digits of phone, without the +: a 10 digit number gets the country code 1,
+    so '(813) 555-1234' and 8135551234 both give '18135551234'. None if phone holds no digits.'''
+    digits = NON_DIGIT_PATTERN.sub('', str(phone if phone is not None else ''))
+    if len(digits) == 10:
+        return '1' + digits
+    return digits or None
+
 class Contact:
-    def __init__(self, first_name, last_name, phone, email, home_tuple):
+    # no per-instance __dict__, the private fields below are all a contact holds
+    __slots__ = ('__name', '__firstName', '__lastName', '__phone', '__email', '__home', 'id')
+
+    def __init__(self, first_name, last_name, phone, email, home_tuple, contact_id=None):
         self.name=first_name + " " + last_name
+        # the parts of the name as they are stored, which may hold spaces themselves
+        self.__firstName = first_name
+        self.__lastName = last_name
         self.phone=phone
         self.email=email
         # tuple to hold street, city, state, zip
         self.home=home_tuple
+        # row id of the contact in its user's table, None until it is stored
+        self.id=contact_id
+
+    @classmethod
+    def FromRow(cls, first_name, last_name, phone, email, home_tuple, contact_id=None):
+        '''Build a contact from values that were validated before they were stored, skipping the setters'''
+        contact = cls.__new__(cls)
+        # a name stored without its first or last part reads back as an empty part
+        contact.__name = (first_name or '') + " " + (last_name or '')
+        contact.__firstName = first_name
+        contact.__lastName = last_name
+        contact.__phone = phone
+        contact.__email = email
+        contact.__home = home_tuple
+        contact.id = contact_id
+        return contact
 
     def __str__(self):
         return "Name: {0}\nPhone Number: {1}\nE-mail Address: {2}\nHome Address: {3}".format(self.name,
@@ -30,21 +94,26 @@ class Contact:
     def __repr__(self):
         return str(self)
 
+    def Fields(self):
+        '''Returns the eight column values of the contact, in DatabaseInterface.KEYS order, as given:
+        a missing value stays None, where the properties would give the text 'None'.'''
+        return (self.__firstName, self.__lastName, self.__phone, self.__email) + tuple(self.__home)
+
     # __lt__ used for sorting
     def __lt__(self, other):
         return (self.name, self.phone, self.email, self.home) < (other.name, other.phone, other.email, other.home)
 
     @property
     def name(self):
-        return "{}".format(self.__name)
+        return str(self.__name)
 
     @property
     def phone(self):
-        return "{}".format(self.__phone)
+        return str(self.__phone)
 
     @property
     def email(self):
-        return "{}".format(self.__email)
+        return str(self.__email)
 
     @property
     def home(self):
@@ -53,43 +122,99 @@ class Contact:
     @name.setter
     def name(self, name):
         self.__name=name
+        # a name set as a whole is split at its first space
+        self.__firstName, space, self.__lastName = str(name).partition(' ')
 
     @phone.setter
     def phone(self, phone):
-        # regex pattern to take care of acceptable phone numbers
-        phonePattern=re.compile('^\s*(?:\+?(\d{1,3}))?[-. (]*(\d{3})[-. )]*(\d{3})[-. ]*(\d{4})(?: *x(\d+))?\s*$')
-        # check if phone matches regex pattern and 10 char
-        if phonePattern.match(str(phone)) and len(str(phone))==10:
-            self.__phone=phone
-        # check if phone entry is empty
-        elif not phone:
+        # check if phone is empty or 10 digits
+        if ValidPhone(phone):
             self.__phone=phone
         else:
             raise InvalidContactPhoneException
 
     @email.setter
     def email(self, email):
-        # email pattern to check if input matches acceptable email
-        emailPattern=re.compile("[^@]+@[^@]+\.[^@]+")
         # check if email matches regex pattern or empty field
-        if emailPattern.match(email) or not email:
+        if ValidEmail(email):
             self.__email=email
         else:
             raise InvalidContactEmailException
 
     @home.setter
     def home(self, address_info):
-        zipCodePattern = re.compile(r'.*(\d{5}(\-\d{4})?)$')
-        # check if every field is completed and zip code matches 5 numbers
-        if all(address_info) and zipCodePattern.match(str(address_info[3])) and len(str(address_info[3]))==5:
-            self.__home = address_info
-        # check if none of the fields are completed
-        elif not all(address_info):
+        # check if the address is incomplete, or complete with a zip code of 5 numbers
+        if ValidAddress(address_info):
             self.__home = address_info
         # if neither, then raise InvalidContactAddressException
         else:
             raise InvalidContactAddressException
 
+##########################Batch validation##############################################################################
+class ValidationReport:
+    '''Result of ValidateColumns. errors lists the (row, field, value) of every field that failed its rule,
+    in row order; field is the column name (Phone, Email or Zip).'''
+    def __init__(self, rows):
+        self.rows = rows
+        self.errors = []
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    @property
+    def invalidRows(self):
+        return sorted(set(row for row, field, value in self.errors))
+
+    def ByRow(self):
+        '''Returns a dict of row -> names of its failed fields'''
+        failed = {}
+        for row, field, value in self.errors:
+            failed.setdefault(row, []).append(field)
+        return failed
+
+    def __str__(self):
+        return '{} of {} rows failed validation'.format(len(self.invalidRows), self.rows)
+
+def ValidateColumns(phones=None, emails=None, zips=None, streets=None, cities=None, states=None):
+    '''Validates whole columns of contact fields at once, with the rules the Contact setters use, and
+    returns a ValidationReport. All given columns must have the same length; row n of each is one contact.
+    A zip is only checked where street, city and state are filled in too, when those columns are given.
+    Each column is checked by a single regular expression pass over the joined values, which only stops on
+    the values that fail, so validating a million rows costs about as much as joining them.'''
+    columns = [column for column in (phones, emails, zips, streets, cities, states) if column is not None]
+    rows = len(columns[0]) if columns else 0
+    if any(len(column) != rows for column in columns):
+        raise ValueError('columns of different lengths')
+    report = ValidationReport(rows)
+    errors = []
+    if phones is not None:
+        errors.extend((row, 'Phone', phones[row]) for row in _InvalidRows(phones, PHONE_RULE))
+    if emails is not None:
+        errors.extend((row, 'Email', emails[row]) for row in _InvalidRows(emails, EMAIL_RULE))
+    if zips is not None:
+        errors.extend((row, 'Zip', zips[row]) for row in _InvalidRows(zips, ZIP_RULE)
+                      if all(column[row] for column in (streets, cities, states) if column is not None))
+    report.errors = sorted(errors, key=lambda error: error[0])
+    return report
+
+def _InvalidRows(values, rule):
+    # row numbers of the values that are neither empty nor a full match of rule
+    texts = [str(value) if value else '' for value in values]
+    text = '\n'.join(texts)
+    if text.count('\n') != len(texts) - 1:
+        # some values hold line breaks themselves, which no rule accepts
+        pattern = re.compile(rule)
+        return [row for row, value in enumerate(texts) if value and pattern.fullmatch(value) is None]
+    invalid = []
+    row = 0
+    position = 0
+    for match in re.finditer(r'^(?!(?:{})?$)'.format(rule), text, re.MULTILINE):
+        row += text.count('\n', position, match.start())
+        position = match.start()
+        invalid.append(row)
+    return invalid
+
 ##########################DatabaseInterface Class#######################################################################
 # Exceptions when working with Database
 class UserAlreadyExistsException(Exception):
@@ -98,6 +223,342 @@ class UserNotFoundException(Exception):
     pass
 class DatabaseNotConnectedException(Exception):
     pass
+class ContactAlreadyExistsException(Exception):
+    pass
+class ChangesCompactedException(Exception):
+    pass
+
+# Counts returned by DatabaseInterface.AddContacts
+AddContactsResult = namedtuple('AddContactsResult', ['inserted', 'skipped', 'rejected'])
+
+# Entry of the change log returned by DatabaseInterface.ChangesSince: operation is 'insert', 'update' or 'delete'
+Change = namedtuple('Change', ['version', 'contactId', 'operation'])
+
+class ChangeSet:
+    '''The contacts a DatabaseInterface wrote, as returned by TakeChanges. A position is the (sort key, id) of a
+    contact in the name order of the lists, the same as the cursors of ContactsPage.
+    inserted and deleted map the ids of the contacts to their position, updated maps them to (old, new) positions.
+    The changes are net: a contact inserted then edited is only inserted, one inserted then deleted is not there.
+    reload is set after writes that are not listed (AddContacts, Rollback, more than limit contacts changed),
+    lists have to be read again.'''
+    # changes listed at most, a connection whose changes are never taken does not grow without bound
+    limit = 10000
+
+    def __init__(self):
+        self.inserted = {}
+        self.updated = {}
+        self.deleted = {}
+        self.reload = False
+
+    def __bool__(self):
+        return self.reload or bool(self.inserted or self.updated or self.deleted)
+
+    def Insert(self, position):
+        self.inserted[position[1]] = position
+        self.__checkLimit()
+
+    def Update(self, old, new):
+        if new[1] in self.inserted:
+            self.inserted[new[1]] = new
+        else:
+            self.updated[new[1]] = (self.updated.get(new[1], (old,))[0], new)
+        self.__checkLimit()
+
+    def Delete(self, position):
+        if self.inserted.pop(position[1], None) is None:
+            self.deleted[position[1]] = self.updated.pop(position[1], (position,))[0]
+        self.__checkLimit()
+
+    def __checkLimit(self):
+        if len(self.inserted) + len(self.updated) + len(self.deleted) > ChangeSet.limit:
+            self.inserted.clear()
+            self.updated.clear()
+            self.deleted.clear()
+            self.reload = True
+
+# Words as the FTS5 unicode61 tokenizer sees them: runs of letters and digits
+SEARCH_TOKEN_PATTERN = re.compile(r'[^\W_]+')
+
+class ContactCache:
+    '''Identity map of the hydrated contacts of one user: at most one Contact per id, least recently used first.
+    version is the PRAGMA data_version the contacts were read at; when another connection commits
+    it changes and the contacts changed since logVersion, the change log version, are evicted.
+    complete is True while every contact of the user is held.'''
+    def __init__(self, maxSize=200000):
+        self.maxSize = maxSize
+        self.contacts = OrderedDict()
+        self.complete = False
+        self.version = None
+        self.logVersion = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def Get(self, contactId):
+        contact = self.contacts.get(contactId)
+        if contact is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.contacts.move_to_end(contactId)
+        return contact
+
+    def Put(self, contact):
+        self.contacts[contact.id] = contact
+        self.contacts.move_to_end(contact.id)
+        while len(self.contacts) > self.maxSize:
+            self.contacts.popitem(last=False)
+            self.evictions += 1
+            self.complete = False
+
+    def Remove(self, contactId):
+        self.contacts.pop(contactId, None)
+
+    def Clear(self):
+        self.contacts.clear()
+        self.complete = False
+
+    @property
+    def Stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self.contacts), 'complete': self.complete, 'version': self.version}
+
+def Levenshtein(a, b):
+    '''Returns the number of single character insertions, deletions and substitutions turning a into b.
+    Bit-parallel (Myers, as formulated by Hyyrö): a column of the edit distance table is an int of len(b) bits.'''
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return len(a)
+    # bit i of positions[c] is set when b[i] is c
+    positions = {}
+    for i, c in enumerate(b):
+        positions[c] = positions.get(c, 0) | (1 << i)
+    mask = (1 << len(b)) - 1
+    last = 1 << (len(b) - 1)
+    # vertical differences +1 and -1 between the cells of the current column
+    plus = mask
+    minus = 0
+    distance = len(b)
+    for c in a:
+        equal = positions.get(c, 0)
+        vertical = equal | minus
+        horizontal = (((equal & plus) + plus) ^ plus) | equal
+        horizontalPlus = minus | ~(horizontal | plus)
+        horizontalMinus = plus & horizontal
+        if horizontalPlus & last:
+            distance += 1
+        elif horizontalMinus & last:
+            distance -= 1
+        horizontalPlus = (horizontalPlus << 1) | 1
+        horizontalMinus <<= 1
+        plus = (horizontalMinus | ~(vertical | horizontalPlus)) & mask
+        minus = horizontalPlus & vertical & mask
+    return distance
+
+class BKTree:
+    '''Burkhard-Keller tree of words under Levenshtein distance, each word holding a set of ids.
+    Search only visits the subtrees whose distance to their parent is within the search radius of the
+    parent's distance to the query, which the triangle inequality allows, so it reads a fraction of the words.'''
+    def __init__(self):
+        # a node is [word, ids, {distance to word: child node}]
+        self.root = None
+        # word -> its node, so that words already in are found without walking the tree
+        self.nodes = {}
+
+    def Add(self, word, itemId):
+        node = self.nodes.get(word)
+        if node is not None:
+            node[1].add(itemId)
+            return
+        newNode = self.nodes[word] = [word, {itemId}, {}]
+        if self.root is None:
+            self.root = newNode
+            return
+        node = self.root
+        while True:
+            distance = Levenshtein(word, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = newNode
+                return
+            node = child
+
+    def Remove(self, word, itemId):
+        # the node of a word stays in the tree, as its children hang off it, with no ids
+        node = self.nodes.get(word)
+        if node is not None:
+            node[1].discard(itemId)
+
+    def Search(self, word, radius):
+        '''Returns the (distance, ids) of the words within radius of word'''
+        results = []
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node = nodes.pop()
+            distance = Levenshtein(word, node[0])
+            if distance <= radius and node[1]:
+                results.append((distance, node[1]))
+            for childDistance, child in node[2].items():
+                if distance - radius <= childDistance <= distance + radius:
+                    nodes.append(child)
+        return results
+
+class FuzzyNameIndex:
+    '''BK-tree of the words of contact names, lower cased, for typo tolerant name search.
+    Kept up to date one contact at a time with Add and Remove.'''
+    def __init__(self):
+        self.tree = BKTree()
+        # contact id -> words of its name
+        self.names = {}
+
+    @staticmethod
+    def Words(name):
+        return SEARCH_TOKEN_PATTERN.findall(str(name).lower())
+
+    @staticmethod
+    def Typos(word):
+        '''Number of edits allowed to match word: none for 1 or 2 letters, 1 for 3, 2 for longer words,
+        a swap of two letters being two edits'''
+        return 0 if len(word) <= 2 else 1 if len(word) == 3 else 2
+
+    def Add(self, contactId, name):
+        self.Remove(contactId)
+        words = FuzzyNameIndex.Words(name)
+        self.names[contactId] = words
+        for word in set(words):
+            self.tree.Add(word, contactId)
+
+    def Remove(self, contactId):
+        for word in set(self.names.pop(contactId, ())):
+            self.tree.Remove(word, contactId)
+
+    def Search(self, searchStr, k=10, maxDistance=None):
+        '''Returns the (distance, id) of the k contacts with the smallest distance to searchStr, closest first.
+        Every word of searchStr must be within its allowed typos (or maxDistance) of a word of the name;
+        the distance of a contact is the sum of those of its best matching words.'''
+        scores = None
+        for word in FuzzyNameIndex.Words(searchStr):
+            radius = FuzzyNameIndex.Typos(word) if maxDistance is None else maxDistance
+            best = {}
+            for distance, ids in self.tree.Search(word, radius):
+                for contactId in ids:
+                    if distance < best.get(contactId, radius + 1):
+                        best[contactId] = distance
+            if scores is None:
+                scores = best
+            else:
+                scores = {contactId: scores[contactId] + distance
+                          for contactId, distance in best.items() if contactId in scores}
+            if not scores:
+                return []
+        return heapq.nsmallest(k, ((distance, contactId) for contactId, distance in (scores or {}).items()))
+
+class StorageProfile(namedtuple('StorageProfile', ['journalMode', 'synchronous', 'cacheSize', 'mmapSize',
+                                                     'tempStore', 'busyTimeout'])):
+    '''SQLite settings of a connection: journal mode, synchronous level, page cache size (negative is KiB),
+    memory-mapped bytes, where temporary tables live and how many milliseconds to wait for a lock.
+    WAL lets any number of readers, in this process or others, work while a writer is active.'''
+    # named presets, see StorageProfile.Get
+    PRESETS = {}
+
+    @staticmethod
+    def Get(profile):
+        '''Returns profile itself, or the preset it names'''
+        if isinstance(profile, StorageProfile):
+            return profile
+        if profile not in StorageProfile.PRESETS:
+            raise ValueError('Unknown storage profile {!r}, expected one of {}'
+                             .format(profile, ', '.join(sorted(StorageProfile.PRESETS))))
+        return StorageProfile.PRESETS[profile]
+
+    def Apply(self, connection):
+        '''Set these settings on connection, outside of a transaction'''
+        connection.execute('pragma busy_timeout = {:d}'.format(self.busyTimeout))
+        connection.execute('pragma journal_mode = {}'.format(self.journalMode))
+        connection.execute('pragma synchronous = {}'.format(self.synchronous))
+        connection.execute('pragma cache_size = {:d}'.format(self.cacheSize))
+        connection.execute('pragma mmap_size = {:d}'.format(self.mmapSize))
+        connection.execute('pragma temp_store = {}'.format(self.tempStore))
+
+# Every commit reaches the disk before it returns
+StorageProfile.PRESETS['durable'] = StorageProfile('WAL', 'FULL', -2000, 0, 'DEFAULT', 5000)
+# Commits survive a crash of the program but the last ones may be lost on power failure; the default
+StorageProfile.PRESETS['balanced'] = StorageProfile('WAL', 'NORMAL', -16000, 64 * 2**20, 'MEMORY', 5000)
+# Large imports: nothing is synced and a big cache holds the index pages, see DatabaseInterface.BulkLoad
+StorageProfile.PRESETS['bulk-load'] = StorageProfile('WAL', 'OFF', -256000, 256 * 2**20, 'MEMORY', 30000)
+
+class ConnectionPool:
+    '''Connections to one database file shared by every DatabaseInterface of the process.
+    Acquire() hands out an idle connection, or opens one if there is none, and Release() takes it back;
+    at most size idle connections are kept open. A connection is used by one thread at a time but may
+    move between threads, so pages and worker threads all draw from the same pool.
+    The schema of the database is set up by the first Connect only.'''
+    __pools = {}
+    __poolsLock = threading.Lock()
+
+    def __init__(self, path, size=4):
+        self.path = path
+        self.size = size
+        self.__lock = threading.Lock()
+        self.__idle = []
+        self.__open = 0
+        self.__inUse = 0
+        self.__schemaReady = False
+
+    @staticmethod
+    def For(path):
+        '''Returns the pool of the database file at path, creating it on first use'''
+        path = os.path.abspath(path)
+        with ConnectionPool.__poolsLock:
+            if path not in ConnectionPool.__pools:
+                ConnectionPool.__pools[path] = ConnectionPool(path)
+            return ConnectionPool.__pools[path]
+
+    def Acquire(self):
+        with self.__lock:
+            self.__inUse += 1
+            if self.__idle:
+                return self.__idle.pop()
+            self.__open += 1
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def Release(self, connection, commit=True):
+        '''Give back a connection, committing or rolling back what it left pending'''
+        if commit:
+            connection.commit()
+        else:
+            connection.rollback()
+        with self.__lock:
+            self.__inUse -= 1
+            if len(self.__idle) < self.size:
+                self.__idle.append(connection)
+                return
+            self.__open -= 1
+        connection.close()
+
+    def EnsureTables(self, connection):
+        '''Set up the schema of the database through connection, unless it already was'''
+        with self.__lock:
+            if not self.__schemaReady:
+                DatabaseInterface.CreateTables(connection)
+                connection.commit()
+                self.__schemaReady = True
+
+    def Close(self):
+        '''Close the idle connections'''
+        with self.__lock:
+            idle, self.__idle = self.__idle, []
+            self.__open -= len(idle)
+        for connection in idle:
+            connection.close()
+
+    @property
+    def Stats(self):
+        with self.__lock:
+            return {'open': self.__open, 'idle': len(self.__idle), 'inUse': self.__inUse}
 
 class DatabaseInterface:
     '''Interface between the program functionality and the database storage of data.'''
@@ -111,6 +572,11 @@ class DatabaseInterface:
         City = 'City'
         State = 'State'
         Zip = 'Zip'
+        # stable row id and owner of a contact, not contact fields
+        Id = 'Id'
+        UserId = 'UserId'
+        # Phone as NormalizePhone gives it, computed by SQLite, see PHONE_DIGITS
+        PhoneDigits = 'PhoneDigits'
 
         def __iter__(self):
             yield DatabaseInterface.KEYS.FirstName
@@ -122,11 +588,43 @@ class DatabaseInterface:
             yield DatabaseInterface.KEYS.State
             yield DatabaseInterface.KEYS.Zip
 
-    def __init__(self, username):
+    # Order of the contact lists: last name then first name, ignoring case, then id.
+    # The Contacts table has an index on (UserId, key), cursors of ContactsPage and SearchPage are (key, id) pairs.
+    SORT_KEY = "ifnull(lower({}), '') || char(31) || ifnull(lower({}), '')".format(KEYS.LastName, KEYS.FirstName)
+    # SQLite's lower() only folds ASCII letters
+    ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+    # SQL version of NormalizePhone(Phone) for the phones a Contact accepts, stripped of the usual separators
+    # in case older rows hold formatted numbers. The int affinity of Phone drops leading zeros, they are put back.
+    # PhoneDigits is a virtual column computed with it; only its index, on (UserId, PhoneDigits), stores the value.
+    PHONE_DIGITS = '''case when length({0}) = 10 then '1' || {0} else nullif({0}, '') end'''.format(
+        "replace(replace(replace(replace(replace(replace("
+        "case when typeof({0}) = 'integer' then printf('%010d', {0}) else {0} end,"
+        " '-', ''), ' ', ''), '(', ''), ')', ''), '.', ''), '+', '')".format(KEYS.Phone))
+
+    # Inserts the UserId and the eight contact fields, unless the user already has a contact with the same name
+    INSERT_CONTACT = '''insert or ignore into Contacts ({}, {}, {}, {}, {}, {}, {}, {}, {})
+                        values (?, ?, ?, ?, ?, ?, ?, ?, ?)'''.format(KEYS.UserId, KEYS.FirstName, KEYS.LastName,
+                                                                 KEYS.Phone, KEYS.Email, KEYS.Street, KEYS.City,
+                                                                 KEYS.State, KEYS.Zip)
+
+    def __init__(self, username, profile='balanced'):
         self.__currentUser = str(username)
+        self.__profile = StorageProfile.Get(profile)
         if self.__currentUser == ':memory:':
             self.__currentUser = 'DEBUG'
+        self.__userId = None
         self.__dbConnection = None
+        self.__pool = None
+        self.__cache = ContactCache()
+        # FuzzyNameIndex of the user's contacts, built by the first FuzzySearch
+        self.__fuzzy = None
+        # Id up to which the contacts are in __fuzzy while it is being built, None once they all are
+        self.__fuzzyIndexed = None
+        # set by Interrupt, stops the build of __fuzzy
+        self.__interrupted = False
+        # writes not yet handed out by TakeChanges
+        self.__changes = ChangeSet()
 
     def __enter__(self):
         self.Connect()
@@ -135,26 +633,171 @@ class DatabaseInterface:
     def __exit__(self, exc_type, exc_value, traceback):
         self.CloseOut()
 
-    def __rowToContact(self, row):
-        return Contact(row[DatabaseInterface.KEYS.FirstName],
-                       row[DatabaseInterface.KEYS.LastName],
-                       row[DatabaseInterface.KEYS.Phone],
-                       row[DatabaseInterface.KEYS.Email],
-                       (row[DatabaseInterface.KEYS.Street],
-                       row[DatabaseInterface.KEYS.City],
-                       row[DatabaseInterface.KEYS.State],
-                       row[DatabaseInterface.KEYS.Zip]))
+    def __rowToContact(self, row, cache=True):
+        # contacts already in the cache are reused as they are, new ones are added to it if cache is true
+        contact = self.__cache.contacts.get(row[DatabaseInterface.KEYS.Id])
+        if contact is not None:
+            return contact
+        # rows were validated when they were stored
+        contact = Contact.FromRow(row[DatabaseInterface.KEYS.FirstName],
+                                  row[DatabaseInterface.KEYS.LastName],
+                                  row[DatabaseInterface.KEYS.Phone],
+                                  row[DatabaseInterface.KEYS.Email],
+                                  (row[DatabaseInterface.KEYS.Street],
+                                   row[DatabaseInterface.KEYS.City],
+                                   row[DatabaseInterface.KEYS.State],
+                                   row[DatabaseInterface.KEYS.Zip]),
+                                  row[DatabaseInterface.KEYS.Id])
+        if cache:
+            self.__cache.Put(contact)
+        return contact
+
+    def __iterRows(self, cursor, batchSize):
+        # hydrate the rows of cursor batchSize at a time, without caching them
+        rows = cursor.fetchmany(batchSize)
+        while rows:
+            for row in rows:
+                yield self.__rowToContact(row, cache=False)
+            rows = cursor.fetchmany(batchSize)
+
+    def __checkCache(self):
+        # if another connection committed changes, evict the contacts it changed from the cache and index their
+        # names again in the fuzzy index, or drop them both when the change log no longer goes back far enough
+        # or went back, as after a restore
+        version = self.__dbConnection.execute('pragma data_version').fetchone()[0]
+        if version == self.__cache.version:
+            return
+        self.__cache.version = version
+        latest = self.DataVersion
+        try:
+            if self.__cache.logVersion is None or self.__userId is None:
+                raise ChangesCompactedException()
+            changes = self.ChangesSince(self.__cache.logVersion)
+        except ChangesCompactedException:
+            self.__cache.Clear()
+            self.__fuzzy = None
+            self.__cache.logVersion = latest
+            return
+        for change in changes:
+            self.__cache.Remove(change.contactId)
+            if change.operation != 'delete':
+                # inserted and updated contacts are read again when asked for
+                self.__cache.complete = False
+        if self.__fuzzy is not None:
+            for contactId in set(change.contactId for change in changes):
+                row = self.__dbConnection.execute('select {}, {} from Contacts where Id=? and UserId=?'
+                                                  .format(*DatabaseInterface.KEYS()),
+                                                  (contactId, self.__userId)).fetchone()
+                if row is None:
+                    self.__fuzzy.Remove(contactId)
+                else:
+                    self.__fuzzy.Add(contactId, '{} {}'.format(row[0] or '', row[1] or ''))
+        self.__cache.logVersion = max([latest] + [change.version for change in changes])
+
+    def __positions(self, condition, params):
+        # (sort key, id) positions of the user's rows matching condition, see ChangeSet
+        return [(row[0], row[1]) for row in
+                self.__dbConnection.execute('select {}, Id from Contacts where UserId=? and ({})'
+                                            .format(DatabaseInterface.SORT_KEY, condition),
+                                            (self.__user(),) + tuple(params)).fetchall()]
+
+    def __user(self):
+        # id of the current user, contacts belong to registered users only
+        if self.__userId is None:
+            raise UserNotFoundException()
+        return self.__userId
+
+    def __contactId(self, contact):
+        # contacts are given either by id or as a Contact, which may carry its id
+        if isinstance(contact, int):
+            return contact
+        return getattr(contact, 'id', None)
 
     @property
     def CurrentUser(self):
         return self.__currentUser
 
+    @staticmethod
+    def Position(contact):
+        '''Returns the (sort key, id) position of contact in the name order of the lists, SORT_KEY computed in Python'''
+        # from the stored name parts, either of which may hold spaces, a NULL one being ''
+        name = ['' if part is None else str(part) for part in contact.Fields()[:2]]
+        lower = DatabaseInterface.ASCII_LOWER
+        return (name[1].translate(lower) + '\x1f' + name[0].translate(lower), contact.id)
+
     @property
     def Contacts(self):
         if self.__dbConnection == None:
             raise DatabaseNotConnectedException()
-        return [self.__rowToContact(row) for row in
-                self.__dbConnection.execute('select * from {}'.format(self.__currentUser)).fetchall()]
+        self.__checkCache()
+        if self.__cache.complete:
+            self.__cache.hits += 1
+            return list(self.__cache.contacts.values())
+        self.__cache.misses += 1
+        contacts = [self.__rowToContact(row) for row in
+                    self.__dbConnection.execute('select * from Contacts where UserId=?', (self.__user(),)).fetchall()]
+        self.__cache.complete = len(contacts) <= self.__cache.maxSize
+        return contacts
+
+    def IterContacts(self, batchSize=500, ordered=False):
+        '''Generator over every contact of the user, in no particular order, reading batchSize rows at a time.
+        Memory use does not grow with the size of the book. Do not change contacts while iterating.
+        With ordered, the contacts come in name order, a ContactsPage of batchSize at a time.'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        self.__checkCache()
+        if ordered:
+            contacts, cursor = self.__orderedPage('UserId=?', (self.__user(),), None, batchSize, cache=False)
+            while contacts:
+                yield from contacts
+                contacts, cursor = self.__orderedPage('UserId=?', (self.__user(),), cursor, batchSize, cache=False)
+            return
+        # read in the order of an index on UserId, so that no sort is needed
+        yield from self.__iterRows(self.__dbConnection.execute('select * from Contacts where UserId=?',
+                                                               (self.__user(),)), batchSize)
+
+    @property
+    def CacheStats(self):
+        '''Hit, miss and eviction counters of the contact cache'''
+        return self.__cache.Stats
+
+    @property
+    def ContactCount(self):
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        return self.__dbConnection.execute('select count(*) from Contacts where UserId=?',
+                                           (self.__user(),)).fetchone()[0]
+
+    def ContactsWindow(self, offset, limit):
+        '''Returns limit contacts, starting with the offset-th one, in name order'''
+        return self.ContactsPage(limit=limit, offset=offset)[0]
+
+    def ContactsPage(self, after=None, limit=200, offset=0):
+        '''Returns (contacts, cursor): the limit contacts following cursor after in name order, or the first ones
+        (skipping offset of them) when after is None. cursor is the position of the last contact returned,
+        pass it as after to get the next page; it is None once there are no contacts left.
+        A page is read straight from the sort index, so it costs O(limit) wherever it is in the book.'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        self.__checkCache()
+        return self.__orderedPage('UserId=?', (self.__user(),), after, limit, offset)
+
+    def __orderedPage(self, condition, params, after, limit, offset=0, cache=True):
+        # one page of the rows matching condition, which selects rows of the user, in SORT_KEY order
+        params = tuple(params)
+        if after is not None:
+            # (key, Id) > after, written so that the key bound seeks into the sort index
+            condition = '({0}) and {1} >= ? and ({1} > ? or Id > ?)'.format(condition, DatabaseInterface.SORT_KEY)
+            params = params + (after[0], after[0], after[1])
+        rows = self.__dbConnection.execute('''select *, {0} from Contacts where {1}
+                                              order by {0}, Id limit ? offset ?'''
+                                           .format(DatabaseInterface.SORT_KEY, condition),
+                                           params + (limit, offset)).fetchall()
+        if not rows:
+            return [], None
+        # the last row ends with its sort key
+        cursor = (rows[-1][-1], rows[-1][DatabaseInterface.KEYS.Id])
+        return [self.__rowToContact(row, cache) for row in rows], cursor
 
     @property
     def Users(self):
@@ -163,20 +806,152 @@ class DatabaseInterface:
         return [row['username'] for row in self.__dbConnection.execute('select username from Users').fetchall()]
 
     def Connect(self):
-        '''Connect to the database for the current user'''
-        self.__dbConnection = sqlite3.connect(os.path.join(os.getcwd(), 'contacts.db')
-                                              if self.__currentUser != 'DEBUG' else ':memory:')  # debug
-        self.__dbConnection.row_factory = sqlite3.Row
-        self.__dbConnection.execute('''create table if not exists {} ({} text, {} text, {} int, {} text, {} text, {} text, {} text, {} text)'''
-                                    .format(self.__currentUser, *DatabaseInterface.KEYS()))
-        self.__dbConnection.execute('''create table if not exists Users (username text PRIMARY KEY, password text)''')
+        '''Connect to the database for the current user.
+        The connection comes from the ConnectionPool of contacts.db and goes back to it on Close.'''
+        self.__cache.Clear()
+        self.__cache.version = None
+        if self.__currentUser == 'DEBUG':
+            self.__dbConnection = sqlite3.connect(':memory:', check_same_thread=False)  # debug
+            self.__dbConnection.row_factory = sqlite3.Row
+            DatabaseInterface.CreateTables(self.__dbConnection)
+            self.RegisterCurrentUser(None)
+        else:
+            self.__pool = ConnectionPool.For(os.path.join(os.getcwd(), 'contacts.db'))
+            self.__dbConnection = self.__pool.Acquire()
+            self.__profile.Apply(self.__dbConnection)
+            self.__pool.EnsureTables(self.__dbConnection)
+        if Instrumentation.active is not None:
+            self.__dbConnection = Instrumentation.active.Wrap(self.__dbConnection)
+        # None until the user is registered
+        row = self.__dbConnection.execute('select Id from Users where username=?', (self.__currentUser,)).fetchone()
+        self.__userId = row['Id'] if row is not None else None
+        self.__cache.logVersion = self.DataVersion
+
+    @property
+    def Profile(self):
+        '''The StorageProfile of the connection'''
+        return self.__profile
+
+    @contextlib.contextmanager
+    def BulkLoad(self, profile='bulk-load'):
+        '''Use profile, the bulk-load preset by default, for the duration of a with block, e.g. around
+        a large AddContacts. The block is committed when it ends and the profile of the database is restored.'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        self.__dbConnection.commit()
+        StorageProfile.Get(profile).Apply(self.__dbConnection)
+        try:
+            yield self
+            self.__dbConnection.commit()
+        finally:
+            if self.__dbConnection is not None:
+                self.__dbConnection.rollback()
+                self.__profile.Apply(self.__dbConnection)
+
+    @staticmethod
+    def CreateTables(connection):
+        '''Create the Users and Contacts tables, their indexes and the search index, if they do not exist yet.
+        The contacts of every user are in the one Contacts table, keyed by the Id of their user in Users.
+        A Users table from before user ids is given an Id column, keeping the rowid of every user as its id.'''
+        columns = [row[1] for row in connection.execute('pragma table_info(Users)').fetchall()]
+        if columns and DatabaseInterface.KEYS.Id not in columns:
+            connection.execute('alter table Users rename to Users_old')
+        connection.execute('''create table if not exists Users (Id integer primary key, username text unique not null,
+                                                             password text)''')
+        if columns and DatabaseInterface.KEYS.Id not in columns:
+            connection.execute('insert into Users (Id, username, password) select rowid, username, password from Users_old')
+            connection.execute('drop table Users_old')
+        connection.execute('''create table if not exists Contacts ({} integer primary key,
+                              {} integer not null references Users (Id),
+                              {} text, {} text, {} int, {} text, {} text, {} text, {} text, {} text,
+                              {} text generated always as ({}) virtual)'''
+                           .format(DatabaseInterface.KEYS.Id, DatabaseInterface.KEYS.UserId, *DatabaseInterface.KEYS(),
+                                   DatabaseInterface.KEYS.PhoneDigits, DatabaseInterface.PHONE_DIGITS))
+        # Contacts tables from before PhoneDigits, whose phone index was on the Phone column as stored
+        if DatabaseInterface.KEYS.PhoneDigits not in [row[1] for row in
+                                                      connection.execute('pragma table_xinfo(Contacts)').fetchall()]:
+            connection.execute('''alter table Contacts add column {} text generated always as ({}) virtual'''
+                               .format(DatabaseInterface.KEYS.PhoneDigits, DatabaseInterface.PHONE_DIGITS))
+            connection.execute('drop index if exists Contacts_phone')
+        # every lookup is within the contacts of one user, so every index starts with UserId
+        connection.execute('''create index if not exists Contacts_sort on Contacts ({}, {})'''
+                           .format(DatabaseInterface.KEYS.UserId, DatabaseInterface.SORT_KEY))
+        connection.execute('''create unique index if not exists Contacts_name on Contacts ({}, {}, {})'''
+                           .format(DatabaseInterface.KEYS.UserId,
+                                   DatabaseInterface.KEYS.FirstName,
+                                   DatabaseInterface.KEYS.LastName))
+        # the user's rows in Id order, the rowid ending every index entry: a range seek per user
+        connection.execute('''create index if not exists Contacts_user on Contacts ({})'''
+                           .format(DatabaseInterface.KEYS.UserId))
+        connection.execute('''create index if not exists Contacts_phone on Contacts ({}, {})'''
+                           .format(DatabaseInterface.KEYS.UserId, DatabaseInterface.KEYS.PhoneDigits))
+        connection.execute('''create index if not exists Contacts_email on Contacts ({}, {})'''
+                           .format(DatabaseInterface.KEYS.UserId, DatabaseInterface.KEYS.Email))
+        DatabaseInterface.BuildSearchIndex(connection)
+        DatabaseInterface.BuildChangeLog(connection)
+
+    @staticmethod
+    def BuildChangeLog(connection):
+        '''Create the ChangeLog of Contacts, kept by triggers: one (Version, UserId, ContactId, Operation) row per
+        insert, update and delete. Versions only ever grow, autoincrement does not reuse those of compacted rows.
+        ChangeConsumers holds the version each named consumer of the log has caught up to, see CompactChanges.'''
+        connection.execute('''create table if not exists ChangeLog (Version integer primary key autoincrement,
+                              {} integer not null, ContactId integer not null, Operation text not null)'''
+                           .format(DatabaseInterface.KEYS.UserId))
+        connection.execute('''create index if not exists ChangeLog_user on ChangeLog ({}, Version)'''
+                           .format(DatabaseInterface.KEYS.UserId))
+        connection.execute('''create table if not exists ChangeConsumers (Name text primary key,
+                              Version integer not null)''')
+        for operation, row in (('insert', 'new'), ('update', 'new'), ('delete', 'old')):
+            connection.execute('''create trigger if not exists Contacts_log_{0} after {0} on Contacts begin
+                                  insert into ChangeLog ({1}, ContactId, Operation) values ({2}.{1}, {2}.{3}, '{0}');
+                                  end'''.format(operation, DatabaseInterface.KEYS.UserId, row,
+                                                 DatabaseInterface.KEYS.Id))
+
+    @staticmethod
+    def RestartChangeLog(connection, version=0):
+        '''Empty the ChangeLog of connection and have its versions go on after both version and the last one it
+        handed out, so that ChangesSince raises a ChangesCompactedException for every version read before, as is
+        needed when the content of the database was replaced, e.g. by a restore. Consumers of the log read
+        everything again.'''
+        latest = connection.execute('''select seq from sqlite_sequence where name='ChangeLog' ''').fetchone()
+        restart = max(version, latest[0] if latest is not None else 0) + 1
+        connection.execute('delete from ChangeLog')
+        if not connection.execute('''update sqlite_sequence set seq=? where name='ChangeLog' ''', (restart,)).rowcount:
+            connection.execute('''insert into sqlite_sequence (name, seq) values ('ChangeLog', ?)''', (restart,))
+
+    @staticmethod
+    def BuildSearchIndex(connection):
+        '''Create the FTS5 shadow index of Contacts, Contacts_fts, and the triggers that keep it in sync with every
+        insert, update and delete. Its UserId column restricts a search to one user within the index.
+        An index created when Contacts already holds rows is filled from those rows.'''
+        columns = [DatabaseInterface.KEYS.UserId] + list(DatabaseInterface.KEYS())
+        exists = connection.execute('''select 1 from sqlite_master where type='table' and name='Contacts_fts' ''').fetchone()
+        connection.execute('''create virtual table if not exists Contacts_fts using fts5({}, content='Contacts',
+                              content_rowid='{}', tokenize='unicode61 remove_diacritics 0')'''
+                           .format(', '.join(columns), DatabaseInterface.KEYS.Id))
+        newValues = ', '.join('new.' + column for column in columns)
+        oldValues = ', '.join('old.' + column for column in columns)
+        columns = ', '.join(columns)
+        connection.execute('''create trigger if not exists Contacts_fts_insert after insert on Contacts begin
+                              insert into Contacts_fts (rowid, {0}) values (new.Id, {1});
+                              end'''.format(columns, newValues))
+        connection.execute('''create trigger if not exists Contacts_fts_delete after delete on Contacts begin
+                              insert into Contacts_fts (Contacts_fts, rowid, {0}) values ('delete', old.Id, {1});
+                              end'''.format(columns, oldValues))
+        connection.execute('''create trigger if not exists Contacts_fts_update after update on Contacts begin
+                              insert into Contacts_fts (Contacts_fts, rowid, {0}) values ('delete', old.Id, {2});
+                              insert into Contacts_fts (rowid, {0}) values (new.Id, {1});
+                              end'''.format(columns, newValues, oldValues))
+        if not exists:
+            connection.execute('''insert into Contacts_fts (Contacts_fts) values ('rebuild')''')
 
     def UserExists(self):
         '''Returns true if the current user of this database interface exists, false otherwise'''
         if self.__dbConnection == None:
             raise DatabaseNotConnectedException()
-        return 0 != len(
-            self.__dbConnection.execute('''select * from Users where username=?''', (self.__currentUser,)).fetchall())
+        return self.__dbConnection.execute('''select 1 from Users where username=?''',
+                                           (self.__currentUser,)).fetchone() is not None
 
     def RegisterCurrentUser(self, password):
         '''Register a new user to the users table. Raises a UserAlreadyExists exception if username already exists'''
@@ -185,8 +960,8 @@ class DatabaseInterface:
         if 0 != len(self.__dbConnection.execute('''select * from Users where username=?''',
                                                 (self.__currentUser,)).fetchall()):
             raise UserAlreadyExistsException()
-        self.__dbConnection.execute('''insert into Users (username, password) values (?, ?)''',
-                                    (self.__currentUser, password))
+        self.__userId = self.__dbConnection.execute('''insert into Users (username, password) values (?, ?)''',
+                                                    (self.__currentUser, password)).lastrowid
 
     def CheckPassword(self, password):
         '''Returns true if the current user exists and his password is password'''
@@ -200,6 +975,56 @@ class DatabaseInterface:
         except IndexError:
             return False
 
+    @property
+    def DataVersion(self):
+        '''Version of the latest change to any contact, as logged in the ChangeLog; 0 before the first one'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        row = self.__dbConnection.execute('''select seq from sqlite_sequence where name='ChangeLog' ''').fetchone()
+        return row[0] if row is not None else 0
+
+    def ChangesSince(self, version):
+        '''Returns the Changes made to the user's contacts after version, oldest first: a range scan of the
+        change log, so polling costs O(changes). Pass the version of the last Change, or the DataVersion read
+        before the contacts were, to the next call.
+        Raises a ChangesCompactedException if changes after version were compacted away, or if version is ahead
+        of the log, which was replaced, e.g. by restoring a backup: read everything again.'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        latest = self.DataVersion
+        oldest = self.__dbConnection.execute('select min(Version) from ChangeLog').fetchone()[0]
+        # compaction deletes every version up to some point, versions are otherwise consecutive
+        if version < (oldest - 1 if oldest is not None else latest) or version > latest:
+            raise ChangesCompactedException()
+        return [Change(*row) for row in
+                self.__dbConnection.execute('''select Version, ContactId, Operation from ChangeLog
+                                               where {}=? and Version > ? order by Version'''
+                                            .format(DatabaseInterface.KEYS.UserId),
+                                            (self.__user(), version)).fetchall()]
+
+    def AckChanges(self, consumer, version):
+        '''Record that the consumer named consumer has caught up to version, registering it if it is new.
+        The log is kept for it until it does.'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        self.__dbConnection.execute('''insert into ChangeConsumers (Name, Version) values (?, ?) on conflict (Name)
+                                       do update set Version=max(Version, excluded.Version)''', (str(consumer), version))
+
+    def ForgetConsumer(self, consumer):
+        '''Stop keeping the log for the consumer named consumer'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        self.__dbConnection.execute('delete from ChangeConsumers where Name=?', (str(consumer),))
+
+    def CompactChanges(self):
+        '''Delete the change log entries every consumer has caught up to, all of them if there are no consumers.
+        Returns the number of entries deleted.'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        acked = self.__dbConnection.execute('select min(Version) from ChangeConsumers').fetchone()[0]
+        return self.__dbConnection.execute('delete from ChangeLog where Version <= ?',
+                                           (acked if acked is not None else self.DataVersion,)).rowcount
+
     def Commit(self):
         '''Commit changes to the database.
         Not strictly necessary, as all changes will be committed
@@ -209,12 +1034,31 @@ class DatabaseInterface:
         if self.__dbConnection:
             self.__dbConnection.commit()
 
+    def Rollback(self):
+        '''Discard the changes made since the last commit'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        self.__cache.Clear()
+        self.__fuzzy = None
+        self.__dbConnection.rollback()
+        # the changes undone may have been handed out already
+        self.__changes = ChangeSet()
+        self.__changes.reload = True
+
     def Close(self):
-        '''Close the database connection without committing.
+        '''Close the database connection without committing, returning it to the pool.
         Not for the faint of heart.'''
         if self.__dbConnection == None:
             raise DatabaseNotConnectedException()
-        self.__dbConnection.close()
+        self.__cache.Clear()
+        self.__fuzzy = None
+        self.__changes = ChangeSet()
+        connection = Instrumentation.Unwrap(self.__dbConnection)
+        if self.__pool is None:
+            connection.close()
+        else:
+            self.__pool.Release(connection, commit=False)
+        self.__dbConnection = None
 
     def CloseOut(self):
         '''Commit changes and close the database connection'''
@@ -223,108 +1067,946 @@ class DatabaseInterface:
         self.Commit()
         self.Close()
 
+    def TakeChanges(self):
+        '''Returns the ChangeSet of the writes made since the last call, and starts a new one.
+        Lists of contacts apply it to show the writes without reading the whole book again.'''
+        changes, self.__changes = self.__changes, ChangeSet()
+        return changes
+
+    def Interrupt(self):
+        '''Abort the query running on this connection, it raises sqlite3.OperationalError.
+        A FuzzySearch building its index stops after the batch of names it is on, and raises the same.
+        Safe to call from another thread than the one running the query.'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        self.__interrupted = True
+        self.__dbConnection.interrupt()
+
     def AddContact(self, contact):
-        '''Add contact into the current user's database'''
+        '''Add contact into the current user's database, and set contact.id to its row id.
+        Returns the id, or None if a contact with the same name is already in.'''
         if self.__dbConnection == None:
             raise DatabaseNotConnectedException()
-        if self.__dbConnection.execute('''select exists(select 1 from {} where {}=? and {}=? limit 1)'''
-                                               .format(self.__currentUser,
-                                                       DatabaseInterface.KEYS.FirstName,
-                                                       DatabaseInterface.KEYS.LastName),
-                                       (contact.name.split(' '))).fetchone()[0] == 0:
-            name = None
-            try:
-                name = contact.name.split()
-            except AttributeError:
-                name = [None, None]
-            if len(name) < 2:
-                name.append(None)
-            self.__dbConnection.execute('''insert into {} ({}, {}, {}, {}, {}, {}, {}, {}) values (?, ?, ?, ?, ?, ?, ?, ?)'''
-                                        .format(self.__currentUser, *DatabaseInterface.KEYS()),
-                                        (name[0],
-                                         name[1],
-                                         contact.phone,
-                                         contact.email,
-                                         contact.home[0],
-                                         contact.home[1],
-                                         contact.home[2],
-                                         contact.home[3]))
+        cursor = self.__dbConnection.execute(DatabaseInterface.INSERT_CONTACT,
+                                             (self.__user(),) + DatabaseInterface.__contactValues(contact))
+        if cursor.rowcount == 0:
+            return None
+        contact.id = cursor.lastrowid
+        self.__changes.Insert(self.__positions('Id=?', (contact.id,))[0])
+        self.__cache.Put(contact)
+        if self.__fuzzy is not None:
+            self.__fuzzy.Add(contact.id, contact.name)
+        return contact.id
+
+    def AddContacts(self, contacts, chunkSize=1000):
+        '''Add many contacts in a single transaction, which is committed when they are all in.
+        contacts is any iterable, generators included, of Contacts or of
+        (first_name, last_name, phone, email, home_tuple) tuples, which are validated as a Contact would.
+        Contacts whose name is already in are skipped, tuples that are not valid contacts are rejected.
+        Tuples are validated a chunk at a time with ValidateColumns.
+        Returns the AddContactsResult(inserted, skipped, rejected) counts.'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        userId = self.__user()
+        inserted = skipped = rejected = 0
+        contacts = iter(contacts)
+        with self.__dbConnection:
+            while True:
+                chunk = list(itertools.islice(contacts, chunkSize))
+                if not chunk:
+                    break
+                rows = []
+                unchecked = []
+                for contact in chunk:
+                    if isinstance(contact, Contact):
+                        rows.append((userId,) + DatabaseInterface.__contactValues(contact))
+                        continue
+                    try:
+                        first_name, last_name, phone, email, home_tuple = contact
+                        home_tuple = tuple(home_tuple)
+                        if len(home_tuple) != 4:
+                            raise ValueError()
+                        # the name is built here so that a missing one is rejected like in Contact()
+                        first_name + " " + last_name
+                        unchecked.append((first_name, last_name, phone, email, home_tuple))
+                    except (TypeError, ValueError):
+                        rejected += 1
+                report = ValidateColumns(phones=[fields[2] for fields in unchecked],
+                                         emails=[fields[3] for fields in unchecked],
+                                         zips=[fields[4][3] for fields in unchecked],
+                                         streets=[fields[4][0] for fields in unchecked],
+                                         cities=[fields[4][1] for fields in unchecked],
+                                         states=[fields[4][2] for fields in unchecked])
+                invalid = set(report.invalidRows)
+                rejected += len(invalid)
+                rows.extend((userId,) + fields[:4] + fields[4]
+                            for row, fields in enumerate(unchecked) if row not in invalid)
+                if not rows:
+                    continue
+                added = self.__dbConnection.executemany(DatabaseInterface.INSERT_CONTACT, rows).rowcount
+                inserted += added
+                skipped += len(rows) - added
+        # the new contacts were not hydrated, the cache no longer holds the whole book
+        self.__cache.complete = False
+        self.__fuzzy = None
+        if inserted:
+            self.__changes.reload = True
+        return AddContactsResult(inserted, skipped, rejected)
+
+    @staticmethod
+    def __contactValues(contact):
+        # the eight column values of a contact, in KEYS order, None stored as NULL
+        try:
+            return contact.Fields()
+        except AttributeError:
+            return (None,) * 8
+
+    def GetContact(self, contactId):
+        '''Returns the contact of the user with id contactId, or None if there is none'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        self.__checkCache()
+        contact = self.__cache.Get(contactId)
+        if contact is not None:
+            return contact
+        row = self.__dbConnection.execute('select * from Contacts where Id=? and UserId=?',
+                                          (contactId, self.__user())).fetchone()
+        return self.__rowToContact(row) if row is not None else None
 
     def Search(self, searchStr):
-        '''Returns a list of contacts that contain searchStr anywhere within any of their columns.
-        e.g. Search(813) will return people with 813 phone numbers and people who live on 813 North St.
-        Wildcards: % is 0 or more characters; _ is any single character. e.g. Search(8_3) returns numbers with 813 and 863.'''
+        '''Returns a list, in name order, of the contacts with a word in any of their columns starting with each word of searchStr.
+        e.g. Search(813) will return people with 813 phone numbers and people who live on 813 North St,
+        and Search('spe mas') will return Spenser Mason. Words are looked up in the FTS5 index of Contacts.
+        Wildcards: % is 0 or more characters; _ is any single character. e.g. Search(8_3) returns numbers with 813 and 863.
+        A searchStr using wildcards (or holding no words at all) is matched anywhere within the columns instead.'''
         if self.__dbConnection == None:
             raise DatabaseNotConnectedException()
+        self.__checkCache()
+        return [self.__rowToContact(row) for row in self.__search(searchStr).fetchall()]
+
+    def IterSearch(self, searchStr, batchSize=500):
+        '''Generator version of Search, reading batchSize rows at a time'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        self.__checkCache()
+        yield from self.__iterRows(self.__search(searchStr), batchSize)
+
+    def SearchPage(self, searchStr, after=None, limit=200):
+        '''Returns (contacts, cursor): one page of the results of Search(searchStr), see ContactsPage'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        self.__checkCache()
+        return self.__orderedPage(*self.__searchCondition(searchStr), after, limit)
+
+    def __search(self, searchStr):
+        # cursor over the rows matching searchStr, in name order
+        condition, params = self.__searchCondition(searchStr)
+        return self.__dbConnection.execute('select * from Contacts where {} order by {}, Id'
+                                           .format(condition, DatabaseInterface.SORT_KEY), params)
+
+    def __searchCondition(self, searchStr):
+        # where clause, and its parameters, selecting the rows of the user matching searchStr
+        searchStr = str(searchStr)
+        tokens = DatabaseInterface.SearchTokens(searchStr)
+        if tokens:
+            # each word is a prefix of a word of a contact field, and the row is one of the user's.
+            # The unary + keeps SQLite from walking Contacts_sort over every row of the user: the matches are
+            # looked up by rowid and only they are sorted.
+            return ('+UserId=? and Id in (select rowid from Contacts_fts where Contacts_fts match ?)',
+                    (self.__user(),
+                     '{} : "{}" AND {{{}}} : ({})'.format(DatabaseInterface.KEYS.UserId, self.__user(),
+                                                           ' '.join(DatabaseInterface.KEYS()),
+                                                           ' '.join('"{}"*'.format(token) for token in tokens))))
+        # like looks at every row of the user anyway, reading them in Contacts_sort order saves the sort
         searchStr = '%' + searchStr + '%'
-        return [self.__rowToContact(row)
-                for row in self.__dbConnection.execute('''select * from {}
-                where {} like ? or
+        return ('''UserId=? and ({} like ? or
                 {} like ? or
                 {} like ? or
                 {} like ? or
                 {} like ? or
                 {} like ? or
                 {} like ? or
-                {} like ?'''
-                                                       .format(self.__currentUser,
-                                                               *DatabaseInterface.KEYS()),
-                                                       [searchStr for i in range(8)]).fetchall()]
+                {} like ?)'''.format(*DatabaseInterface.KEYS()),
+                [self.__user()] + [searchStr for i in range(8)])
+
+    @staticmethod
+    def SearchTokens(searchStr):
+        '''Returns the words Search looks up in the FTS5 index for searchStr,
+        or an empty list when searchStr has to be matched with LIKE instead'''
+        if '%' in searchStr or '_' in searchStr:
+            return []
+        return SEARCH_TOKEN_PATTERN.findall(searchStr)
+
+    def FuzzySearch(self, searchStr, k=10, maxDistance=None):
+        '''Returns the k contacts whose name is closest to searchStr, closest first, allowing for typos:
+        FuzzySearch('Jonh Smtih') finds John Smith. Each word of searchStr must be within a few edits of a word
+        of the name (see FuzzyNameIndex.Typos), or within maxDistance if it is given.
+        The names are looked up in a BK-tree built on the first call and kept up to date by this interface's
+        own changes, and by those committed by other connections as the ChangeLog gives them.
+        The tree is built batchSize names at a time; an Interrupt stops the build, and the next call goes on
+        from where it stopped.'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        self.__checkCache()
+        self.__interrupted = False
+        self.__buildFuzzy()
+        contacts = (self.GetContact(contactId) for distance, contactId in self.__fuzzy.Search(searchStr, k, maxDistance))
+        return [contact for contact in contacts if contact is not None]
+
+    def __buildFuzzy(self, batchSize=2000):
+        # index the names of the user's contacts that are not in __fuzzy yet, in Id order
+        if self.__fuzzy is None:
+            self.__fuzzy = FuzzyNameIndex()
+            self.__fuzzyIndexed = 0
+        while self.__fuzzyIndexed is not None:
+            if self.__interrupted:
+                raise sqlite3.OperationalError('interrupted')
+            # a seek into Contacts_user, which holds the user's rows in Id order, where the last batch ended
+            rows = self.__dbConnection.execute('''select {0}, {1}, {2} from Contacts where UserId=? and {0} > ?
+                                                  order by {0} limit ?'''
+                                               .format(DatabaseInterface.KEYS.Id, *DatabaseInterface.KEYS()),
+                                               (self.__user(), self.__fuzzyIndexed, batchSize)).fetchall()
+            for row in rows:
+                self.__fuzzy.Add(row[0], '{} {}'.format(row[1] or '', row[2] or ''))
+            self.__fuzzyIndexed = rows[-1][0] if len(rows) == batchSize else None
+
+    def FindByPhone(self, number):
+        '''Returns the contacts, in id order, whose phone is number in any format: caller ID.
+        One lookup in the phone index, which holds them in id order.'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        self.__checkCache()
+        return [self.__rowToContact(row) for row in
+                self.__dbConnection.execute('''select * from Contacts where UserId=? and {}=? order by Id'''
+                                            .format(DatabaseInterface.KEYS.PhoneDigits),
+                                            (self.__user(), NormalizePhone(number))).fetchall()]
+
+    def FindByPhonePrefix(self, prefix, limit=200):
+        '''Returns at most limit contacts, in phone order, whose phone starts with the digits of prefix,
+        e.g. an area code: FindByPhonePrefix(813). The country code 1 is assumed unless prefix starts with it,
+        as no area code does. A range scan of the phone index.'''
+        if self.__dbConnection == None:
+            raise DatabaseNotConnectedException()
+        self.__checkCache()
+        digits = NON_DIGIT_PATTERN.sub('', str(prefix))
+        if not digits.startswith('1'):
+            digits = '1' + digits
+        # ':' is the character right after '9', so the range holds every number starting with digits
+        return [self.__rowToContact(row) for row in
+                self.__dbConnection.execute('''select * from Contacts where UserId=? and {0} >= ? and {0} < ?
+                                               order by {0}, Id limit ?'''.format(DatabaseInterface.KEYS.PhoneDigits),
+                                            (self.__user(), digits, digits + ':', limit)).fetchall()]
 
     def DeleteContact(self, contact):
-        '''Given a contact, deletes contacts with matching fields.'''
+        '''Given a contact id, or a contact, deletes that contact.
+        A contact without an id deletes the contacts with a matching name.'''
         if self.__dbConnection == None:
             raise DatabaseNotConnectedException()
-        name = None
-        try:
-            name = contact.name.split()
-        except AttributeError:
-            name = [None, None]
-        if len(name) < 2:
-            name.append(None)
-        self.__dbConnection.execute('delete from {} where {}=? and {}=?'
-                                    .format(self.__currentUser,
-                                            *DatabaseInterface.KEYS()),
-                                    (name[0],
+        contactId = self.__contactId(contact)
+        if contactId is not None:
+            for position in self.__positions('Id=?', (contactId,)):
+                self.__changes.Delete(position)
+            self.__dbConnection.execute('delete from Contacts where Id=? and UserId=?', (contactId, self.__user()))
+            self.__cache.Remove(contactId)
+            if self.__fuzzy is not None:
+                self.__fuzzy.Remove(contactId)
+            return
+        self.__cache.Clear()
+        self.__fuzzy = None
+        name = DatabaseInterface.__contactValues(contact)[:2]
+        for position in self.__positions('{}=? and {}=?'.format(*DatabaseInterface.KEYS()), name[:2]):
+            self.__changes.Delete(position)
+        self.__dbConnection.execute('delete from Contacts where UserId=? and {}=? and {}=?'
+                                    .format(*DatabaseInterface.KEYS()),
+                                    (self.__user(),
+                                     name[0],
                                      name[1]))
 
     def EditContact(self, contact, newContact):
-        '''Given a contact, replaces the contact in the database with newContact'''
+        '''Given a contact id, or a contact, replaces the contact in the database with newContact.
+        A contact without an id replaces the contacts with a matching name.
+        Raises a ContactAlreadyExistsException if another contact already has the name of newContact.'''
         if self.__dbConnection == None:
             raise DatabaseNotConnectedException()
-        name = None
         try:
-            name = contact.name.split()
-        except AttributeError:
-            name = [None, None]
-        if len(name) < 2:
-            name.append(None)
-        newName = None
+            self.__editContact(contact, newContact)
+        except sqlite3.IntegrityError:
+            raise ContactAlreadyExistsException()
+
+    def __editContact(self, contact, newContact):
+        contactId = self.__contactId(contact)
+        newValues = DatabaseInterface.__contactValues(newContact)
+        if contactId is not None:
+            old = self.__positions('Id=?', (contactId,))
+            if self.__dbConnection.execute('''update Contacts set {}=?, {}=?, {}=?, {}=?, {}=?, {}=?, {}=?, {}=?
+                                              where Id=? and UserId=?'''
+                                           .format(*DatabaseInterface.KEYS()),
+                                           newValues + (contactId, self.__user())).rowcount:
+                newContact.id = contactId
+                self.__changes.Update(old[0], self.__positions('Id=?', (contactId,))[0])
+                self.__cache.Put(newContact)
+                if self.__fuzzy is not None:
+                    self.__fuzzy.Add(contactId, newContact.name)
+            return
+        self.__cache.Clear()
+        self.__fuzzy = None
+        name = DatabaseInterface.__contactValues(contact)[:2]
+        old = self.__positions('{}=? and {}=?'.format(*DatabaseInterface.KEYS()), name[:2])
+        self.__dbConnection.execute('''update Contacts set {}=?, {}=?, {}=?, {}=?, {}=?, {}=?, {}=?, {}=?
+                                       where UserId=? and {}=? and {}=?'''
+                                    .format(*DatabaseInterface.KEYS(),
+                                            *DatabaseInterface.KEYS()),
+                                    newValues + (self.__user(), name[0], name[1]))
+        for position in old:
+            self.__changes.Update(position, self.__positions('Id=?', (position[1],))[0])
+
+
+##########################SearchSession Class#########################################################################
+class SearchSession:
+    '''Search-as-you-type on top of DatabaseInterface.Search.
+    A query that extends an earlier one (e.g. "mas" after "ma") can only match fewer contacts,
+    so it is answered by filtering the cached results of that earlier query in memory.
+    Going back to an earlier query reuses its cached results, and only a query that does not
+    extend any cached one is sent to the database.'''
+    def __init__(self, database, size=64):
+        self.__database = database
+        self.__size = size
+        # searchStr -> contacts in name order, least recently used first
+        self.__results = OrderedDict()
+
+    def Search(self, searchStr):
+        '''Returns the list of contacts, in name order, that DatabaseInterface.Search would return for searchStr'''
+        searchStr = str(searchStr)
+        if searchStr in self.__results:
+            self.__results.move_to_end(searchStr)
+            return self.__results[searchStr]
+        base = self.__NarrowestCachedPrefix(searchStr)
+        if base is None:
+            contacts = self.__database.Search(searchStr)
+        else:
+            matches = SearchSession.Matcher(searchStr)
+            contacts = [contact for contact in self.__results[base] if matches(contact)]
+        self.__results[searchStr] = contacts
+        if len(self.__results) > self.__size:
+            self.__results.popitem(last=False)
+        return contacts
+
+    def Reset(self):
+        '''Forget every cached result. Call it whenever the contacts in the database change.'''
+        self.__results.clear()
+
+    def __NarrowestCachedPrefix(self, searchStr):
+        # The empty query is the whole book, filtering it in Python would be slower than asking the index
+        wildcard = not DatabaseInterface.SearchTokens(searchStr)
+        for end in range(len(searchStr) - 1, 0, -1):
+            prefix = searchStr[:end]
+            if prefix in self.__results and wildcard == (not DatabaseInterface.SearchTokens(prefix)):
+                return prefix
+        return None
+
+    @staticmethod
+    def Matcher(searchStr):
+        '''Returns a function telling whether a contact is one DatabaseInterface.Search would return for searchStr'''
+        tokens = [token.lower() for token in DatabaseInterface.SearchTokens(searchStr)]
+        if tokens:
+            def matches(contact):
+                words = [word.lower() for field in SearchSession.__Fields(contact)
+                         for word in SEARCH_TOKEN_PATTERN.findall(field)]
+                return all(any(word.startswith(token) for word in words) for token in tokens)
+            return matches
+        # SQLite's like: % is any run of characters, _ any one character, ASCII letters ignore case
+        pattern = re.compile(''.join('.*' if char == '%' else '.' if char == '_' else re.escape(char)
+                                     for char in searchStr), re.ASCII | re.IGNORECASE | re.DOTALL)
+        return lambda contact: any(pattern.search(field) for field in SearchSession.__Fields(contact))
+
+    @staticmethod
+    def __Fields(contact):
+        # the eight searchable columns as stored, a NULL one matches nothing, not the text 'None'
+        return ['' if field is None else str(field) for field in contact.Fields()]
+
+
+##########################QueryWorker Class###########################################################################
+class QueryWorker:
+    '''Runs the contact list queries of a user on a thread of its own, with its own connection,
+    so that the Tk main thread never waits on SQLite. SEARCH answers with the matching contacts in name order,
+    or, when there are none, with FUZZY and the closest names; FUZZY with the closest names, RELOAD with the number
+    of contacts in the book.
+    Submit() queues a query, Results() hands back the answer of the newest one; answers to queries
+    made obsolete by a newer Submit() are dropped, and a running obsolete query is interrupted.
+    A burst of submissions within debounce seconds of each other only runs the last one.'''
+    # Operations that can be submitted
+    SEARCH = 'Search'
+    FUZZY = 'Fuzzy'
+    RELOAD = 'Reload'
+
+    def __init__(self, username, debounce=0.15):
+        self.__username = username
+        self.__debounce = debounce
+        self.__requests = queue.Queue()
+        self.__results = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__generation = 0
+        self.__running = None
+        self.__database = None
+        # set when the cached search results no longer match the book
+        self.__stale = threading.Event()
+        self.__thread = threading.Thread(target=self.__Run, daemon=True)
+        self.__thread.start()
+
+    def Submit(self, operation, *args):
+        '''Queue operation (SEARCH or FUZZY with the search string, or RELOAD) and obsolete every earlier one'''
+        with self.__lock:
+            self.__generation += 1
+            if self.__running is not None and self.__database is not None:
+                self.__database.Interrupt()
+            self.__requests.put((self.__generation, operation, args))
+
+    def Results(self):
+        '''Returns the (operation, result) answers ready for the newest submitted query, without blocking'''
+        results = []
+        while True:
+            try:
+                generation, operation, result = self.__results.get_nowait()
+            except queue.Empty:
+                return results
+            if generation == self.__generation:
+                results.append((operation, result))
+
+    def Invalidate(self):
+        '''Forget the cached search results before the next query. Call it once changes to the contacts are committed.'''
+        self.__stale.set()
+
+    def Close(self):
+        '''Stop the worker thread and close its connection'''
+        with self.__lock:
+            self.__generation += 1
+            if self.__running is not None and self.__database is not None:
+                self.__database.Interrupt()
+        self.__requests.put(None)
+        self.__thread.join()
+
+    def __Run(self):
+        database = DatabaseInterface(self.__username)
+        database.Connect()
+        session = SearchSession(database)
+        with self.__lock:
+            self.__database = database
         try:
-            newName = newContact.name.split()
-        except AttributeError:
-            newName = [None, None]
-        while len(newName) < 2:
-            newName.append(None)
+            request = self.__requests.get()
+            while request is not None:
+                # debounce: keep taking newer requests until the queue stays quiet
+                try:
+                    while True:
+                        newer = self.__requests.get(timeout=self.__debounce)
+                        if newer is None:
+                            return
+                        request = newer
+                except queue.Empty:
+                    pass
+                generation, operation, args = request
+                with self.__lock:
+                    if generation != self.__generation:
+                        request = self.__requests.get()
+                        continue
+                    self.__running = generation
+                if self.__stale.is_set():
+                    self.__stale.clear()
+                    session.Reset()
+                try:
+                    if operation == QueryWorker.RELOAD:
+                        session.Reset()
+                        result = database.ContactCount
+                    elif operation == QueryWorker.FUZZY:
+                        result = database.FuzzySearch(*args)
+                    else:
+                        result = session.Search(*args)
+                        # nothing matches as typed, try the names allowing for typos; a newer request
+                        # interrupts the building of the fuzzy index, which the next fallback goes on with
+                        if not result and DatabaseInterface.SearchTokens(str(args[0])):
+                            operation, result = QueryWorker.FUZZY, database.FuzzySearch(args[0])
+                    self.__results.put((generation, operation, result))
+                except sqlite3.OperationalError:
+                    # interrupted by a newer request
+                    pass
+                finally:
+                    with self.__lock:
+                        self.__running = None
+                request = self.__requests.get()
+        finally:
+            with self.__lock:
+                self.__database = None
+            database.CloseOut()
+
+
+##########################Instrumentation Class########################################################################
+class LatencyHistogram:
+    '''Number of calls that took up to each of BOUNDS seconds (the last bucket is for longer ones),
+    with their total and longest time and the rows they returned or changed'''
+    BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self.buckets = [0] * (len(LatencyHistogram.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+    def Add(self, seconds, rows=0):
+        self.buckets[bisect.bisect_left(LatencyHistogram.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.rows += rows
+
+    def Percentile(self, fraction):
+        '''Upper bound of the bucket holding the fraction-th call, or the longest time when it is past the last bound'''
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(LatencyHistogram.BOUNDS, self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)
+        return self.max
 
-        self.__dbConnection.execute('update {} set {}=?, {}=?, {}=?, {}=?, {}=?, {}=?, {}=?, {}=? where {}=? and {}=?'
-                                    .format(self.__currentUser,
-                                            *DatabaseInterface.KEYS(),
-                                            *DatabaseInterface.KEYS()),
-                                    (newName[0],
-                                     newName[1],
-                                     newContact.phone,
-                                     newContact.email,
-                                     newContact.home[0],
-                                     newContact.home[1],
-                                     newContact.home[2],
-                                     newContact.home[3],
-                                     name[0],
-                                     name[1]))
+    @property
+    def Stats(self):
+        return {'count': self.count, 'total': self.total, 'mean': self.total / self.count if self.count else 0.0,
+                'p50': self.Percentile(0.5), 'p95': self.Percentile(0.95), 'p99': self.Percentile(0.99),
+                'max': self.max, 'rows': self.rows,
+                'buckets': {str(bound): count for bound, count in zip(LatencyHistogram.BOUNDS + ('inf',), self.buckets)
+                            if count}}
+
+class TracedCursor:
+    '''sqlite3.Cursor whose fetches are timed; the statement is recorded once all its rows are read,
+    or when the cursor is dropped'''
+    def __init__(self, cursor, sql, parameters, seconds, connection):
+        self.cursor = cursor
+        self.__sql = sql
+        self.__parameters = parameters
+        self.__seconds = seconds
+        self.__rows = 0
+        self.__connection = connection
+        self.__done = False
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __del__(self):
+        self.__finish()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def __finish(self):
+        if self.__done:
+            return
+        self.__done = True
+        # statements that return no rows report the rows they changed
+        rows = self.__rows if self.cursor.description is not None else max(self.cursor.rowcount, 0)
+        self.__connection.instrumentation.RecordStatement(self.__sql, self.__seconds, rows, self.__parameters,
+                                                          self.__connection.connection)
+
+    def __timed(self, fetch, *args):
+        start = time.perf_counter()
+        result = fetch(*args)
+        self.__seconds += time.perf_counter() - start
+        return result
+
+    def fetchone(self):
+        row = self.__timed(self.cursor.fetchone)
+        if row is None:
+            self.__finish()
+        else:
+            self.__rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.cursor.arraysize if size is None else size
+        rows = self.__timed(self.cursor.fetchmany, size)
+        self.__rows += len(rows)
+        if len(rows) < size:
+            self.__finish()
+        return rows
+
+    def fetchall(self):
+        rows = self.__timed(self.cursor.fetchall)
+        self.__rows += len(rows)
+        self.__finish()
+        return rows
+
+class TracedConnection:
+    '''sqlite3.Connection whose statements are timed by instrumentation, see Instrumentation.Wrap'''
+    def __init__(self, connection, instrumentation):
+        self.connection = connection
+        self.instrumentation = instrumentation
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def __enter__(self):
+        return self.connection.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.connection.__exit__(exc_type, exc_value, traceback)
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        cursor = self.connection.execute(sql, parameters)
+        return TracedCursor(cursor, sql, parameters, time.perf_counter() - start, self)
+
+    def executemany(self, sql, parameters):
+        start = time.perf_counter()
+        cursor = self.connection.executemany(sql, parameters)
+        self.instrumentation.RecordStatement(sql, time.perf_counter() - start, max(cursor.rowcount, 0))
+        return cursor
+
+class Instrumentation:
+    '''Opt-in latency tracing of DatabaseInterface.
+    Between Start() and Stop(), every public DatabaseInterface method is timed, and the connections made by Connect
+    time each SQL statement with the rows it returned or changed. A trace callback also counts the statements SQLite
+    runs on its own, such as trigger bodies and transaction control. Statements slower than slowThreshold seconds are
+    logged, with their EXPLAIN QUERY PLAN, to logger and kept in SlowQueries, the last slowLogSize of them.
+    When no instrumentation is started, DatabaseInterface runs exactly as it would without this class.'''
+    # the started Instrumentation, if any
+    active = None
+
+    def __init__(self, slowThreshold=0.05, slowLogSize=100, logger=None):
+        self.slowThreshold = slowThreshold
+        self.logger = logger or logging.getLogger('AddressBook.queries')
+        self.__lock = threading.Lock()
+        self.__methods = {}
+        self.__statements = {}
+        self.__traced = {}
+        self.__slowQueries = deque(maxlen=slowLogSize)
+        self.__originals = {}
 
+    def __enter__(self):
+        self.Start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.Stop()
+
+    def Start(self):
+        '''Instrument DatabaseInterface, and the connections it makes from now on, for this instrumentation'''
+        if Instrumentation.active is not None:
+            Instrumentation.active.Stop()
+        for name, member in list(vars(DatabaseInterface).items()):
+            if name.startswith('_'):
+                continue
+            if isinstance(member, property):
+                timed = property(self.__timed(name, member.fget), member.fset)
+            elif inspect.isgeneratorfunction(member):
+                timed = self.__timedGenerator(name, member)
+            elif inspect.isfunction(member):
+                timed = self.__timed(name, member)
+            else:
+                continue
+            self.__originals[name] = member
+            setattr(DatabaseInterface, name, timed)
+        Instrumentation.active = self
+
+    def Stop(self):
+        '''Put DatabaseInterface back as it was. Connections already instrumented stay so until they are closed.'''
+        for name, member in self.__originals.items():
+            setattr(DatabaseInterface, name, member)
+        self.__originals.clear()
+        if Instrumentation.active is self:
+            Instrumentation.active = None
+
+    def __timed(self, name, method):
+        @functools.wraps(method)
+        def Timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = None
+            try:
+                result = method(*args, **kwargs)
+                return result
+            finally:
+                # contacts returned, as a list or as the list of a page
+                if isinstance(result, tuple) and result and isinstance(result[0], list):
+                    rows = len(result[0])
+                else:
+                    rows = len(result) if isinstance(result, list) else 0
+                self.RecordMethod(name, time.perf_counter() - start, rows)
+        return Timed
+
+    def __timedGenerator(self, name, method):
+        # generators are timed over their whole iteration, the time spent by the caller between items excluded
+        @functools.wraps(method)
+        def Timed(*args, **kwargs):
+            seconds = 0.0
+            rows = 0
+            iterator = method(*args, **kwargs)
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        seconds += time.perf_counter() - start
+                    rows += 1
+                    yield item
+            finally:
+                self.RecordMethod(name, seconds, rows)
+        return Timed
+
+    def Wrap(self, connection):
+        '''Returns connection, traced and with its statements timed by this instrumentation'''
+        connection.set_trace_callback(self.__trace)
+        return TracedConnection(connection, self)
+
+    @staticmethod
+    def Unwrap(connection):
+        '''Returns the sqlite3.Connection of connection, no longer traced'''
+        if isinstance(connection, TracedConnection):
+            connection = connection.connection
+            connection.set_trace_callback(None)
+        return connection
+
+    def __trace(self, sql):
+        # statements as SQLite runs them, with their parameters expanded; counted by trigger or by kind of statement
+        kind = sql.strip()[:80] if sql.lstrip().startswith('--') else sql.split(None, 1)[0].upper() if sql.strip() else ''
+        with self.__lock:
+            self.__traced[kind] = self.__traced.get(kind, 0) + 1
+
+    def RecordMethod(self, name, seconds, rows=0):
+        with self.__lock:
+            if name not in self.__methods:
+                self.__methods[name] = LatencyHistogram()
+            self.__methods[name].Add(seconds, rows)
+
+    def RecordStatement(self, sql, seconds, rows, parameters=None, connection=None):
+        '''Add a run of sql to the statistics; a slow one is explained, through connection, and logged'''
+        sql = ' '.join(sql.split())
+        with self.__lock:
+            if sql not in self.__statements:
+                self.__statements[sql] = LatencyHistogram()
+            self.__statements[sql].Add(seconds, rows)
+        if seconds < self.slowThreshold:
+            return
+        plan = []
+        if connection is not None:
+            try:
+                plan = [row[3] for row in connection.execute('explain query plan ' + sql, parameters or ()).fetchall()]
+            except sqlite3.Error:
+                pass
+        with self.__lock:
+            self.__slowQueries.append({'sql': sql, 'seconds': seconds, 'rows': rows, 'plan': plan})
+        self.logger.warning('Slow query (%.1f ms, %d rows): %s\n  %s', seconds * 1000, rows, sql, '\n  '.join(plan))
+
+    @property
+    def SlowQueries(self):
+        with self.__lock:
+            return list(self.__slowQueries)
+
+    def Reset(self):
+        '''Forget everything recorded so far'''
+        with self.__lock:
+            self.__methods.clear()
+            self.__statements.clear()
+            self.__traced.clear()
+            self.__slowQueries.clear()
+
+    def Dump(self):
+        '''Returns everything recorded, as a dict that json can write'''
+        with self.__lock:
+            return {'methods': {name: histogram.Stats for name, histogram in self.__methods.items()},
+                    'statements': {sql: histogram.Stats for sql, histogram in self.__statements.items()},
+                    'traced': dict(self.__traced),
+                    'slowQueries': list(self.__slowQueries)}
+
+    def Report(self):
+        '''Returns the recorded latencies as text, the slowest in total first'''
+        dump = self.Dump()
+        lines = []
+        for title, stats in (('Methods', dump['methods']), ('Statements', dump['statements'])):
+            lines.append('{:<60} {:>8} {:>10} {:>9} {:>9} {:>9} {:>9}'.format(title, 'calls', 'total ms', 'p50 ms',
+                                                                              'p95 ms', 'max ms', 'rows'))
+            for name, histogram in sorted(stats.items(), key=lambda item: -item[1]['total']):
+                lines.append('{:<60.60} {:>8} {:>10.2f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9}'
+                             .format(name, histogram['count'], histogram['total'] * 1000, histogram['p50'] * 1000,
+                                     histogram['p95'] * 1000, histogram['max'] * 1000, histogram['rows']))
+            lines.append('')
+        lines.append('Traced: ' + ', '.join('{} {}'.format(kind, count) for kind, count in
+                                            sorted(dump['traced'].items(), key=lambda item: -item[1])))
+        for query in dump['slowQueries']:
+            lines.append('Slow ({:.1f} ms, {} rows): {}'.format(query['seconds'] * 1000, query['rows'], query['sql']))
+            lines.extend('  ' + step for step in query['plan'])
+        return '\n'.join(lines)
 
 ##########################################UI Code##################################################################
 
+##### Virtual list of contacts #####
+# Data sources of VirtualListbox: len() is the number of rows, Window(start, stop) returns rows start to stop-1,
+# Apply(changes, database) shows a DatabaseInterface.ChangeSet and returns False if the rows have to be read again.
+# A list of contacts. With ordered, they are in name order and their positions are kept alongside, so that a changed
+# contact is put in its place by bisection; matches tells whether a changed contact belongs in the list at all.
+# Otherwise (e.g. the closest names of a FuzzySearch) contacts are only ever updated in place or removed.
+class ListSource:
+    def __init__(self, items, ordered=False, matches=None):
+        # a copy, the list given may be a cached search result
+        self.items = list(items)
+        self.ordered = ordered
+        # positions of the items, computed by the first Apply
+        self.positions = None
+        self.matches = matches if matches is not None else lambda contact: True
+
+    def __len__(self):
+        return len(self.items)
+
+    def Window(self, start, stop):
+        return self.items[start:stop]
+
+    def Apply(self, changes, database):
+        if changes.reload:
+            return False
+        if self.ordered and self.positions is None:
+            self.positions = [DatabaseInterface.Position(item) for item in self.items]
+        for position in changes.deleted.values():
+            self.__Remove(position)
+        for old, new in changes.updated.values():
+            if self.positions is None:
+                index = self.__Index(old)
+                if index is not None:
+                    self.items[index] = database.GetContact(new[1])
+                continue
+            self.__Remove(old)
+            self.__Insert(new, database)
+        if self.positions is not None:
+            for position in changes.inserted.values():
+                self.__Insert(position, database)
+        return True
+
+    def __Index(self, position):
+        # index of the contact at position, None if it is not in the list
+        if self.positions is None:
+            return next((index for index, item in enumerate(self.items) if item.id == position[1]), None)
+        index = bisect.bisect_left(self.positions, position)
+        return index if index < len(self.positions) and self.positions[index] == position else None
+
+    def __Remove(self, position):
+        index = self.__Index(position)
+        if index is not None:
+            del self.items[index]
+            if self.positions is not None:
+                del self.positions[index]
+
+    def __Insert(self, position, database):
+        contact = database.GetContact(position[1])
+        if contact is not None and self.matches(contact):
+            index = bisect.bisect_left(self.positions, position)
+            self.items.insert(index, contact)
+            self.positions.insert(index, position)
+
+# Pages through the whole phone book of a connected DatabaseInterface, keeping the most recent pages.
+# A page following a cached one is read after its cursor, only jumps (dragging the scrollbar) use an offset.
+class TableSource:
+    def __init__(self, database, count, pageSize=200, pages=16):
+        self.database = database
+        self.count = count
+        self.pageSize = pageSize
+        self.pages = pages
+        # page number -> (contacts, cursor)
+        self.cache = OrderedDict()
+
+    def __len__(self):
+        return self.count
+
+    def Window(self, start, stop):
+        rows = []
+        for page in range(start // self.pageSize, (stop - 1) // self.pageSize + 1):
+            if page not in self.cache:
+                if page - 1 in self.cache and self.cache[page - 1][1] is not None:
+                    self.cache[page] = self.database.ContactsPage(self.cache[page - 1][1], self.pageSize)
+                else:
+                    self.cache[page] = self.database.ContactsPage(limit=self.pageSize, offset=page * self.pageSize)
+                if len(self.cache) > self.pages:
+                    self.cache.popitem(last=False)
+            self.cache.move_to_end(page)
+            rows.extend(self.cache[page][0])
+        offset = start - start // self.pageSize * self.pageSize
+        return rows[offset:offset + stop - start]
+
+    def Apply(self, changes, database):
+        if changes.reload:
+            return False
+        self.count += len(changes.inserted) - len(changes.deleted)
+        positions = list(changes.inserted.values()) + list(changes.deleted.values())
+        positions.extend(position for update in changes.updated.values() for position in update)
+        if positions:
+            # pages ending before the first change are as they were, the others are read again when shown
+            first = min(positions)
+            for page in [page for page, (contacts, cursor) in self.cache.items() if cursor is None or cursor >= first]:
+                del self.cache[page]
+        return True
+
+# A Listbox that only ever holds the rows on screen. The rows are pulled from a data source as the user scrolls,
+# so showing a million contacts costs the same as showing a hundred.
+class VirtualListbox(Frame):
+    def __init__(self, master=None, source=None, label=str, width=25, height=34):
+        Frame.__init__(self, master)
+        self.label = label
+        self.rows = height
+        self.top = 0
+        self.visible = []
+        self.listbox = Listbox(self, width=width, height=height, activestyle='none')
+        self.listbox.pack(side=LEFT, fill=Y)
+        self.scrollbar = Scrollbar(self, orient=VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=RIGHT, fill=Y)
+        self.listbox.bind("<MouseWheel>", lambda event: self.ScrollTo(self.top - (3 if event.delta > 0 else -3)))
+        self.listbox.bind("<Button-4>", lambda event: self.ScrollTo(self.top - 3))
+        self.listbox.bind("<Button-5>", lambda event: self.ScrollTo(self.top + 3))
+        self.SetSource(source if source is not None else ListSource([]))
+
+    # events on the list are events on the rows
+    def bind(self, sequence=None, func=None, add=None):
+        return self.listbox.bind(sequence, func, add)
+
+    def SetSource(self, source):
+        self.source = source
+        self.ScrollTo(self.top)
+
+    # shows a DatabaseInterface.ChangeSet by redrawing the rows on screen, False if the source has to be read again
+    def Apply(self, changes, database):
+        if not self.source.Apply(changes, database):
+            return False
+        self.ScrollTo(self.top)
+        return True
+
+    def ScrollTo(self, top):
+        self.top = max(0, min(top, len(self.source) - self.rows))
+        self.visible = self.source.Window(self.top, min(self.top + self.rows, len(self.source)))
+        self.listbox.delete(0, END)
+        if self.visible:
+            self.listbox.insert(END, *[self.label(item) for item in self.visible])
+        if len(self.source):
+            self.scrollbar.set(self.top / len(self.source), (self.top + len(self.visible)) / len(self.source))
+        else:
+            self.scrollbar.set(0, 1)
+        # drawing the list swallows the scroll events, nothing to return to Tk
+        return 'break'
+
+    # scrollbar protocol: ('moveto', fraction) or ('scroll', count, 'units'/'pages')
+    def yview(self, *args):
+        if args[0] == 'moveto':
+            self.ScrollTo(int(float(args[1]) * len(self.source)))
+        elif args[0] == 'scroll':
+            step = self.rows if args[2] == 'pages' else 1
+            self.ScrollTo(self.top + int(args[1]) * step)
+
+    # item shown at the index-th row on screen
+    def Item(self, index):
+        return self.visible[index]
+
 ##### Code for Login Page #####
 class LoginP():
     def __init__(self, master):
@@ -374,16 +2056,14 @@ class LoginP():
             with DatabaseInterface(self.login_input()) as db:
                 if not db.UserExists():
                    self.loginFailLabel.config(text="User not found", fg="red")
-                else:
-                   if not db.CheckPassword(self.password_input()):
-                       self.loginFailLabel.config(text="Incorrect password", fg="red")
-                   else:
-                       # move to main page if inputs for username and password are correct
-                       self.LoadMainPage(self.login_input())
+                   return
+                if not db.CheckPassword(self.password_input()):
+                   self.loginFailLabel.config(text="Incorrect password", fg="red")
+                   return
+            # move to main page if inputs for username and password are correct
+            self.LoadMainPage(self.login_input())
         except DatabaseNotConnectedException:
             self.loginFailLabel.config(text="Failed to connect to database", fg="red")
-        finally:
-            db.CloseOut()
 
     # moves to registration page
     def LoadRegistrationPage(self):
@@ -419,9 +2099,8 @@ class MainP():
         master.geometry("950x550+500+150")
         master.resizable(width=True, height=True)
 
-        self.AddressL = Listbox()
+        self.AddressL = VirtualListbox(label=lambda contact: contact.name, width=25, height=34)
         self.AddressL.place(x=0, y=0)
-        self.AddressL.config(width=25, height=34)
         self.AddressL.bind("<Double-Button-1>", self.OnDoubleClick)
 
         self.insideFrame.place(x=275, y=485)
@@ -429,9 +2108,13 @@ class MainP():
         # connect to the user's phone book
         self.user = DatabaseInterface(user)
         self.user.Connect()
+        # list queries run on a worker thread, PollQueries shows their results
+        self.queries = QueryWorker(user)
+        self.pollId = None
+        self.PollQueries()
         self.contact = None
         self.operation = None
-        self.UpdatePhoneBook()
+        self.queries.Submit(QueryWorker.RELOAD)
 
         # new button calls NewButtonClick to add a contact
         self.newButton = Button(self.insideFrame, text='New', width=18,
@@ -519,43 +2202,51 @@ class MainP():
 
     # updates list box to show matching results
     def Search(self, *args):
-        self.AddressL.delete(0, END)
-        contacts = sorted(self.user.Search(self.searchStr.get()))
-        for contact in contacts:
-            self.AddressL.insert(END, contact.name)
+        # an empty search is the whole book, paged from the table rather than loaded into a list
+        if self.searchStr.get() == '':
+            self.queries.Submit(QueryWorker.RELOAD)
+        else:
+            self.queries.Submit(QueryWorker.SEARCH, self.searchStr.get())
+
+    # shows the contacts found by the query worker, checks back every 50 ms
+    def PollQueries(self):
+        for operation, result in self.queries.Results():
+            if operation == QueryWorker.RELOAD:
+                self.AddressL.SetSource(TableSource(self.user, result))
+            elif operation == QueryWorker.SEARCH:
+                self.AddressL.SetSource(ListSource(result, True, SearchSession.Matcher(self.searchStr.get())))
+            else:
+                self.AddressL.SetSource(ListSource(result))
+        self.pollId = self.master.after(50, self.PollQueries)
 
     # double click name in list box to show info in entry boxes
     def OnDoubleClick(self, event):
-        widget = event.widget
-        selection = widget.curselection()
-        value = widget.get(selection[0])
-        try:
-            for contact in self.user.Contacts:
-                if contact.name == value:
-                    self.clear_entries()
-                    self.enabled_state()
-
-                    names = contact.name.split()
-                    self.firstNameEntry.insert(0, names[0])
-                    self.lastNameEntry.insert(0, names[1])
-                    self.phoneEntry.insert(0, contact.phone)
-                    self.emailEntry.insert(0, contact.email)
-                    self.streetEntry.insert(0, contact.home[0])
-                    self.cityEntry.insert(0, contact.home[1])
-                    self.stateEntry.insert(0, contact.home[2])
-                    self.zipEntry.insert(0, contact.home[3])
-                    self.contact = self.RetrieveContact()
-                    self.disabled_state()
-        except IndexError:
-            pass
+        selection = event.widget.curselection()
+        if not selection:
+            return
+        contact = self.user.GetContact(self.AddressL.Item(selection[0]).id)
+        if contact is None:
+            return
+        self.clear_entries()
+        self.enabled_state()
+
+        # the fields as stored, a missing one shown empty; Phone reads back as an int, without its leading zeros
+        fields = ['' if field is None else str(field) for field in contact.Fields()]
+        if isinstance(contact.Fields()[2], int):
+            fields[2] = '{:010d}'.format(contact.Fields()[2])
+        entries = (self.firstNameEntry, self.lastNameEntry, self.phoneEntry, self.emailEntry,
+                   self.streetEntry, self.cityEntry, self.stateEntry, self.zipEntry)
+        for entry, field in zip(entries, fields):
+            entry.insert(0, field)
+        self.contact = contact
+        self.disabled_state()
 
-    # Updates list in ALPHABETICAL ORDER
+    # Updates list in ALPHABETICAL ORDER, applying only the contacts changed since the last update
     def UpdatePhoneBook(self):
         self.user.Commit()
-        self.AddressL.delete(0, END)
-        contacts = sorted(self.user.Contacts)
-        for contact in contacts:
-            self.AddressL.insert(END, contact.name)
+        self.queries.Invalidate()
+        if not self.AddressL.Apply(self.user.TakeChanges(), self.user):
+            self.queries.Submit(QueryWorker.RELOAD)
 
     # enables entry boxes if a contact is displayed in entry boxes
     def EditButtonClick(self):
@@ -569,11 +2260,12 @@ class MainP():
                 # if the entry is for a new contact...
                 if self.operation == 1:
                     self.contact = self.RetrieveContact()
-                    self.user.AddContact(self.contact)
+                    if self.user.AddContact(self.contact) is None:
+                        raise ContactAlreadyExistsException()
                 # if its for editing an existing contact...
                 if self.operation == 2:
                     newContact = self.RetrieveContact()
-                    self.user.EditContact(self.contact, newContact)
+                    self.user.EditContact(self.contact.id, newContact)
                 self.contact = None
                 self.operation = None
                 self.UpdatePhoneBook()
@@ -585,6 +2277,8 @@ class MainP():
             self.failLabel.config(text="Invalid e-mail", fg="red")
         except InvalidContactAddressException:
             self.failLabel.config(text="Invalid zip code", fg="red")
+        except ContactAlreadyExistsException:
+            self.failLabel.config(text="Contact already exists", fg="red")
         except TypeError:
             pass
 
@@ -594,8 +2288,9 @@ class MainP():
         self.operation = 1
 
     def DeleteButtonClick(self):
-        self.contact = self.RetrieveContact()
-        self.user.DeleteContact(self.contact)
+        if self.contact is not None:
+            self.user.DeleteContact(self.contact.id)
+            self.contact = None
         self.UpdatePhoneBook()
         self.clear_entries()
 
@@ -671,6 +2366,8 @@ class MainP():
         self.searchLabel.destroy()
         self.insideFrame.destroy()
         self.LogoutFrame.destroy()
+        self.master.after_cancel(self.pollId)
+        self.queries.Close()
         self.user.CloseOut()
         self.user = None
         self.clear_error_label()
@@ -721,10 +2418,9 @@ class RegisterP():
 
             if self.passwordInput == self.reenteredPasswordInput:
                 with DatabaseInterface(self.usernameInput) as db:
-                    db.Connect()
                     db.RegisterCurrentUser(self.passwordInput)
-                    self.LoadMainPage(db.CurrentUser)
-                    db.CloseOut
+                # the registration is committed before the main page reads the database
+                self.LoadMainPage(db.CurrentUser)
             else:
                 self.errorLabel.config(text="Passwords do not match", fg="red")
         except TypeError:
@@ -0,0 +1,156 @@
+# asyncio interface to the address book
+# AsyncDatabaseInterface has the surface of DatabaseInterface with coroutines in place of blocking calls.
+# The blocking calls run on a bounded thread pool: writes on one connection, reads on separate read connections,
+# each connection serving one call at a time.
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from AddressBook import DatabaseInterface
+
+class AsyncDatabaseInterface:
+    '''asyncio version of DatabaseInterface for the contacts of username.
+    Writes are committed as soon as they are done, so the read connections see them. With the in-memory
+    debug database, which a second connection cannot share, everything goes through the write connection.
+    executor is the thread pool to run on; by default one with a thread per connection is made and owned.'''
+    def __init__(self, username, readers=2, executor=None, profile='balanced'):
+        self.__writer = DatabaseInterface(username, profile)
+        if self.__writer.CurrentUser == 'DEBUG':
+            readers = 0
+        self.__readers = [DatabaseInterface(username, profile) for i in range(readers)]
+        self.__idleReaders = None
+        self.__writeLock = asyncio.Lock()
+        self.__ownsExecutor = executor is None
+        self.__executor = executor or ThreadPoolExecutor(max_workers=readers + 1,
+                                                         thread_name_prefix='AsyncDatabaseInterface')
+
+    async def __aenter__(self):
+        await self.Connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.CloseOut()
+
+    async def __call(self, function, *args):
+        # run a blocking call on the executor
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, functools.partial(function, *args))
+
+    async def __write(self, function, *args):
+        # call a method of the write connection and commit what it did
+        async with self.__writeLock:
+            def Run():
+                try:
+                    result = function(self.__writer, *args)
+                    self.__writer.Commit()
+                    return result
+                except BaseException:
+                    self.__writer.Rollback()
+                    raise
+            return await self.__call(Run)
+
+    async def __read(self, function, *args):
+        # call a method of an idle read connection, or of the write connection when there are none
+        if not self.__readers:
+            async with self.__writeLock:
+                return await self.__call(function, self.__writer, *args)
+        reader = await self.__idleReaders.get()
+        try:
+            return await self.__call(function, reader, *args)
+        finally:
+            self.__idleReaders.put_nowait(reader)
+
+    @property
+    def CurrentUser(self):
+        return self.__writer.CurrentUser
+
+    async def Connect(self):
+        '''Connect the write connection and the read connections'''
+        async with self.__writeLock:
+            await self.__call(self.__writer.Connect)
+        self.__idleReaders = asyncio.Queue()
+        for reader in self.__readers:
+            await self.__call(reader.Connect)
+            self.__idleReaders.put_nowait(reader)
+
+    async def CloseOut(self):
+        '''Commit changes, close every connection and, if it owns it, shut down the executor'''
+        async with self.__writeLock:
+            await self.__call(self.__writer.CloseOut)
+        # wait for the reads in progress to hand their connection back
+        for i in range(len(self.__readers)):
+            await self.__call((await self.__idleReaders.get()).Close)
+        if self.__ownsExecutor:
+            self.__executor.shutdown(wait=False)
+
+    async def Contacts(self):
+        '''Returns every contact of the user'''
+        return await self.__read(lambda db: db.Contacts)
+
+    async def ContactCount(self):
+        return await self.__read(lambda db: db.ContactCount)
+
+    async def ContactsPage(self, after=None, limit=200, offset=0):
+        '''See DatabaseInterface.ContactsPage'''
+        return await self.__read(DatabaseInterface.ContactsPage, after, limit, offset)
+
+    async def GetContact(self, contactId):
+        return await self.__read(DatabaseInterface.GetContact, contactId)
+
+    async def Search(self, searchStr):
+        '''See DatabaseInterface.Search'''
+        return await self.__read(DatabaseInterface.Search, searchStr)
+
+    async def SearchPage(self, searchStr, after=None, limit=200):
+        return await self.__read(DatabaseInterface.SearchPage, searchStr, after, limit)
+
+    async def IterContacts(self, batchSize=500):
+        '''Async iterator over every contact of the user, in name order, reading a ContactsPage of batchSize at a time.
+        The read connection is only held while a page is read.'''
+        contacts, cursor = await self.ContactsPage(limit=batchSize)
+        while contacts:
+            for contact in contacts:
+                yield contact
+            contacts, cursor = await self.ContactsPage(cursor, batchSize)
+
+    async def IterSearch(self, searchStr, batchSize=500):
+        '''Async iterator over the results of Search(searchStr), a SearchPage of batchSize at a time'''
+        contacts, cursor = await self.SearchPage(searchStr, limit=batchSize)
+        while contacts:
+            for contact in contacts:
+                yield contact
+            contacts, cursor = await self.SearchPage(searchStr, cursor, batchSize)
+
+    async def UserExists(self):
+        return await self.__read(DatabaseInterface.UserExists)
+
+    async def CheckPassword(self, password):
+        return await self.__read(DatabaseInterface.CheckPassword, password)
+
+    async def RegisterCurrentUser(self, password):
+        '''Register the user, see DatabaseInterface.RegisterCurrentUser. The read connections are reconnected
+        so that they know the new user.'''
+        await self.__write(DatabaseInterface.RegisterCurrentUser, password)
+        readers = [await self.__idleReaders.get() for i in range(len(self.__readers))]
+        try:
+            for reader in readers:
+                await self.__call(reader.Close)
+                await self.__call(reader.Connect)
+        finally:
+            for reader in readers:
+                self.__idleReaders.put_nowait(reader)
+
+    async def AddContact(self, contact):
+        '''See DatabaseInterface.AddContact'''
+        return await self.__write(DatabaseInterface.AddContact, contact)
+
+    async def AddContacts(self, contacts, chunkSize=1000):
+        '''See DatabaseInterface.AddContacts. contacts is consumed on the executor, so it must not be an async iterable.'''
+        return await self.__write(DatabaseInterface.AddContacts, contacts, chunkSize)
+
+    async def EditContact(self, contact, newContact):
+        '''See DatabaseInterface.EditContact'''
+        return await self.__write(DatabaseInterface.EditContact, contact, newContact)
+
+    async def DeleteContact(self, contact):
+        '''See DatabaseInterface.DeleteContact'''
+        return await self.__write(DatabaseInterface.DeleteContact, contact)
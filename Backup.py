@@ -0,0 +1,232 @@
+# Online backup and restore of contacts.db with the SQLite backup API
+# Users keep working while a backup runs: pages are copied a few at a time with a pause in between,
+# and every step reads a consistent snapshot. Targets ending in .gz are gzip compressed.
+# python ./Backup.py backup <target> [--pages 1024] [--sleep 0.005]
+# python ./Backup.py restore <source> [--pages 1024] [--sleep 0.005]
+# python ./Backup.py export-user <username> <target>
+# python ./Backup.py restore-user <source> [--username NAME] [--replace]
+# Every command takes --database, contacts.db in the working directory by default.
+import argparse
+import contextlib
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from AddressBook import DatabaseInterface, UserNotFoundException
+
+# rows per transaction of RestoreUser, between which other connections get to write
+RESTORE_BATCH = 5000
+
+def Compressed(path):
+    return str(path).endswith('.gz')
+
+@contextlib.contextmanager
+def Uncompressed(path):
+    '''Context manager giving the path of an uncompressed copy of the SQLite file at path, path itself if it is not
+    compressed; a temporary copy is deleted when the block ends'''
+    if not Compressed(path):
+        yield path
+        return
+    handle, temporary = tempfile.mkstemp(suffix='.db', dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(handle, 'wb') as output, gzip.open(path, 'rb') as source:
+            shutil.copyfileobj(source, output, 1 << 20)
+        yield temporary
+    finally:
+        os.remove(temporary)
+
+@contextlib.contextmanager
+def Output(path):
+    '''Context manager giving the path to write an SQLite file to so that it ends up at path,
+    compressed if path ends in .gz. The file is only moved into place once the block succeeds.'''
+    handle, temporary = tempfile.mkstemp(suffix='.db', dir=os.path.dirname(os.path.abspath(path)))
+    os.close(handle)
+    try:
+        yield temporary
+        if Compressed(path):
+            with open(temporary, 'rb') as source, gzip.open(path + '.part', 'wb') as output:
+                shutil.copyfileobj(source, output, 1 << 20)
+            os.replace(path + '.part', path)
+        else:
+            os.replace(temporary, path)
+    finally:
+        for leftover in (temporary, path + '.part'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+def Progress(status, remaining, total):
+    '''progress callback of Connection.backup printing the pages copied so far'''
+    if total:
+        print('\r{} of {} pages copied'.format(total - remaining, total), end='' if remaining else '\n', flush=True)
+
+class CopyRestarted(Exception):
+    pass
+
+def Copy(source, target, pages=1024, sleep=0.005, progress=None, restarts=3):
+    '''Copies the database of the connection source into the connection target, pages at a time, sleeping
+    sleep seconds between steps. A write to source by another connection makes the copy start over; after restarts
+    of them, the rest is copied in a single step, which in WAL mode reads one snapshot without holding up writers.'''
+    copied = 0
+    restarted = 0
+    def Step(status, remaining, total):
+        nonlocal copied, restarted
+        if total - remaining < copied:
+            restarted += 1
+            if restarted > restarts:
+                raise CopyRestarted()
+        copied = total - remaining
+        if progress is not None:
+            progress(status, remaining, total)
+    try:
+        source.backup(target, pages=pages, sleep=sleep, progress=Step)
+    except CopyRestarted:
+        source.backup(target, pages=-1, progress=progress)
+
+def Backup(database, target, pages=1024, sleep=0.005, progress=None):
+    '''Writes a consistent copy of the SQLite file database to target, compressed if target ends in .gz.
+    The copy is a single file, in rollback journal mode, that opens without the -wal file of the original.'''
+    with Output(target) as path:
+        source = sqlite3.connect(database)
+        copy = sqlite3.connect(path)
+        try:
+            Copy(source, copy, pages, sleep, progress)
+            copy.execute('pragma journal_mode=delete')
+        finally:
+            copy.close()
+            source.close()
+
+def Restore(backup, database, pages=1024, sleep=0.005, progress=None):
+    '''Replaces the whole content of the SQLite file database with the backup file backup, compressed or not.
+    Other connections to database wait for the copy to finish. The change log is restarted after the last version
+    database had handed out, so a DatabaseInterface open across the restore drops its cached contacts on its next
+    read; lists already shown from it, and search results cached by a QueryWorker, are not refreshed.'''
+    with Uncompressed(backup) as path:
+        source = sqlite3.connect(path)
+        target = sqlite3.connect(database)
+        try:
+            DatabaseInterface.CreateTables(target)
+            target.commit()
+            version = target.execute('''select seq from sqlite_sequence where name='ChangeLog' ''').fetchone()
+            Copy(source, target, pages, sleep, progress)
+            # a backup from before the change log has none
+            DatabaseInterface.CreateTables(target)
+            DatabaseInterface.RestartChangeLog(target, version[0] if version is not None else 0)
+            target.commit()
+        finally:
+            target.close()
+            source.close()
+
+def ExportUser(database, username, target):
+    '''Writes the account and the contacts of username in the SQLite file database to a new database at target,
+    compressed if target ends in .gz, with the tables of contacts.db. Returns the number of contacts exported.'''
+    with Output(target) as path:
+        export = sqlite3.connect(path)
+        try:
+            DatabaseInterface.CreateTables(export)
+            export.commit()
+            export.execute('attach database ? as source', (database,))
+            # one transaction, so that the user and the contacts come from the same snapshot
+            with export:
+                export.execute('begin')
+                user = export.execute('select Id, password from source.Users where username=?', (username,)).fetchone()
+                if user is None:
+                    raise UserNotFoundException()
+                userId = export.execute('insert into Users (username, password) values (?, ?)',
+                                        (username, user[1])).lastrowid
+                count = export.execute('''insert into Contacts ({0}, {1}) select ?, {1} from source.Contacts
+                                          where {0}=? order by Id'''
+                                       .format(DatabaseInterface.KEYS.UserId, ', '.join(DatabaseInterface.KEYS())),
+                                       (userId, user[0])).rowcount
+                # a fresh book, with nothing to catch up on
+                export.execute('delete from ChangeLog')
+            export.execute('detach database source')
+            export.execute('pragma journal_mode=delete')
+        finally:
+            export.close()
+    return count
+
+def RestoreUser(database, backup, username=None, replace=False, sleep=0.005):
+    '''Copies the contacts of username, by default the only user, from the backup file backup (a Backup or an
+    ExportUser, compressed or not) into the SQLite file database, registering the user with their backed up password
+    if they are not there. Contacts whose name the user already has are kept as they are, unless replace, which
+    deletes the user's contacts first. The copy is made RESTORE_BATCH rows per transaction, sleeping sleep seconds
+    in between, so that other users are not held up. Returns the number of contacts restored.'''
+    with Uncompressed(backup) as path:
+        connection = sqlite3.connect(database)
+        try:
+            DatabaseInterface.CreateTables(connection)
+            connection.commit()
+            connection.execute('attach database ? as backup', (path,))
+            if username is None:
+                users = [row[0] for row in connection.execute('select username from backup.Users').fetchall()]
+                if len(users) != 1:
+                    raise ValueError('{} holds {} users, name the one to restore'.format(backup, len(users)))
+                username = users[0]
+            source = connection.execute('select Id, password from backup.Users where username=?', (username,)).fetchone()
+            if source is None:
+                raise UserNotFoundException()
+            with connection:
+                user = connection.execute('select Id from Users where username=?', (username,)).fetchone()
+                userId = user[0] if user is not None else connection.execute(
+                    'insert into Users (username, password) values (?, ?)', (username, source[1])).lastrowid
+            deleted = replace
+            while deleted:
+                with connection:
+                    deleted = connection.execute('''delete from Contacts where Id in
+                                                    (select Id from Contacts where {}=? limit ?)'''
+                                                 .format(DatabaseInterface.KEYS.UserId),
+                                                 (userId, RESTORE_BATCH)).rowcount
+                time.sleep(sleep)
+            restored = lastId = 0
+            while True:
+                with connection:
+                    rows = connection.execute('''select Id, {1} from backup.Contacts where {0}=? and Id > ?
+                                                 order by Id limit ?'''
+                                              .format(DatabaseInterface.KEYS.UserId, ', '.join(DatabaseInterface.KEYS())),
+                                              (source[0], lastId, RESTORE_BATCH)).fetchall()
+                    if not rows:
+                        break
+                    lastId = rows[-1][0]
+                    restored += connection.executemany(DatabaseInterface.INSERT_CONTACT,
+                                                       [(userId,) + tuple(row[1:]) for row in rows]).rowcount
+                time.sleep(sleep)
+            connection.execute('detach database backup')
+        finally:
+            connection.close()
+    return restored
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Back up and restore the address book without stopping it')
+    parser.add_argument('--database', default=os.path.join(os.getcwd(), 'contacts.db'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, argument in (('backup', 'target'), ('restore', 'source')):
+        command = commands.add_parser(name)
+        command.add_argument(argument, help='backup file, gzip compressed if it ends in .gz')
+        command.add_argument('--pages', type=int, default=1024, help='pages copied per step')
+        command.add_argument('--sleep', type=float, default=0.005, help='seconds between steps')
+    command = commands.add_parser('export-user')
+    command.add_argument('username')
+    command.add_argument('target', help='export file, gzip compressed if it ends in .gz')
+    command = commands.add_parser('restore-user')
+    command.add_argument('source', help='backup or export file')
+    command.add_argument('--username', help='user to restore, needed when source holds several')
+    command.add_argument('--replace', action='store_true', help="delete the user's contacts first")
+    command.add_argument('--sleep', type=float, default=0.005, help='seconds between batches')
+    arguments = parser.parse_args(argv)
+    if arguments.command == 'backup':
+        Backup(arguments.database, arguments.target, arguments.pages, arguments.sleep, Progress)
+    elif arguments.command == 'restore':
+        Restore(arguments.source, arguments.database, arguments.pages, arguments.sleep, Progress)
+    elif arguments.command == 'export-user':
+        print('{} contacts exported'.format(ExportUser(arguments.database, arguments.username, arguments.target)))
+    else:
+        print('{} contacts restored'.format(RestoreUser(arguments.database, arguments.source, arguments.username,
+                                                        arguments.replace, arguments.sleep)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+# Benchmarks of the address book
+# python ./Benchmark.py [--sizes 1k,100k,1M] [--seed 0] [--output results.json]
+#                       [--compare baseline.json] [--threshold 0.2]
+# Every run over the same seed and sizes works on the same synthetic contacts. Results are seconds, lower is better,
+# but for the Contact suite's rates (ending in /s, higher is better) and bytes per instance (lower is better);
+# --compare flags the ones that got worse than the baseline by more than threshold and exits with 1 if any did.
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from AddressBook import Contact, DatabaseInterface, ConnectionPool
+
+# Book sizes by name
+SIZES = {'1k': 1000, '100k': 100000, '1M': 1000000}
+
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+               'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Carlos', 'Karen',
+               'Daniel', 'Lisa', 'Matthew', 'Nancy', 'Anthony', 'Betty', 'Mark', 'Sandra', 'Donald', 'Ashley',
+               'Steven', 'Kimberly', 'Andrew', 'Emily', 'Kenneth', 'Donna', 'Joshua', 'Michelle', 'Kevin', 'Carol',
+               'Brian', 'Amanda', 'George', 'Melissa', 'Timothy', 'Deborah', 'Ronald', 'Stephanie', 'Jason', 'Rebecca',
+               'Spenser', 'Sofia', 'Wei', 'Priya', 'Ahmed', 'Olga', 'Hiroshi', 'Fatima', 'Lucas', 'Chloe']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+              'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+              'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez', 'Lewis', 'Robinson',
+              'Walker', 'Young', 'Allen', 'King', 'Wright', 'Scott', 'Torres', 'Nguyen', 'Hill', 'Flores',
+              'Mason', 'Patel', 'Chen', 'Kowalski', 'Okafor', 'Schmidt', 'Rossi', 'Tanaka', 'Ivanova', 'Dubois']
+STREETS = ['Main St', 'Oak Ave', 'Fowler Ave', 'Bruce B Downs Blvd', 'W North St', 'Dale Mabry Hwy', 'Bayshore Blvd',
+           'Nebraska Ave', 'Pine St', 'Maple Dr', 'Cedar Ln', 'Kennedy Blvd', 'Florida Ave', 'Hillsborough Ave']
+CITIES = [('Tampa', 'FL', 336), ('Orlando', 'FL', 328), ('Miami', 'FL', 331), ('Atlanta', 'GA', 303),
+          ('Austin', 'TX', 787), ('Chicago', 'IL', 606), ('Seattle', 'WA', 981), ('Boston', 'MA', 21)]
+AREA_CODES = ['813', '727', '407', '305', '404', '512', '312', '206', '617', '941']
+MAIL_DOMAINS = ['mail.usf.edu', 'gmail.com', 'yahoo.com', 'outlook.com', 'example.org']
+
+def SampleRow(i):
+    '''Field values of the i-th benchmark contact, as stored in the database'''
+    return ('First{}'.format(i), 'Last{}'.format(i), 8130000000 + i, 'user{}@mail.usf.edu'.format(i),
+            ('{} W North St'.format(i), 'Tampa', 'FL', '{:05d}'.format(i % 100000)))
+
+def SyntheticContacts(count, seed=0):
+    '''Returns count realistic (first_name, last_name, phone, email, home_tuple) tuples, the same ones for the same seed.
+    Names repeat as in a real book, a number is added to the last name where the whole name would.
+    A fifth of the contacts have no e-mail and a tenth no address.'''
+    generator = random.Random(seed)
+    names = set()
+    rows = []
+    for i in range(count):
+        first, last = generator.choice(FIRST_NAMES), generator.choice(LAST_NAMES)
+        if (first, last) in names:
+            last = '{}{}'.format(last, i)
+        names.add((first, last))
+        phone = '{}{:07d}'.format(generator.choice(AREA_CODES), generator.randrange(2000000, 10000000))
+        email = ('{}.{}{}@{}'.format(first, last, generator.randrange(100), generator.choice(MAIL_DOMAINS)).lower()
+                 if generator.random() >= 0.2 else '')
+        if generator.random() >= 0.1:
+            city, state, zipPrefix = generator.choice(CITIES)
+            home = ('{} {}'.format(generator.randrange(1, 20000), generator.choice(STREETS)), city, state,
+                    '{:03d}{:02d}'.format(zipPrefix, generator.randrange(100)))
+        else:
+            home = ('', '', '', '')
+        rows.append((first, last, phone, email, home))
+    return rows
+
+def TimeContacts(build, rows):
+    '''Returns the objects per second build makes out of rows'''
+    start = time.perf_counter()
+    for row in rows:
+        build(*row)
+    return len(rows) / (time.perf_counter() - start)
+
+def BytesPerContact(build, rows):
+    '''Returns the memory held by one object build makes, the field values themselves excluded'''
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    contacts = [build(*row) for row in rows]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    # the list holding them is not part of the contacts
+    return (size - sys.getsizeof(contacts)) / len(contacts)
+
+def ContactBenchmark(count=100000):
+    '''Construction speed and size of Contact, validated and, when available, through the trusted row path'''
+    rows = [SampleRow(i) for i in range(count)]
+    results = {'validated objects/s': TimeContacts(Contact, rows),
+               'bytes/instance': BytesPerContact(Contact, rows)}
+    fromRow = getattr(Contact, 'FromRow', None)
+    if fromRow is not None:
+        results['trusted objects/s'] = TimeContacts(fromRow, rows)
+    with DatabaseInterface(':memory:') as db:
+        for row in rows:
+            db.AddContact(Contact(*row))
+        db.Commit()
+        start = time.perf_counter()
+        db.Search('%')
+        results['hydrated rows/s'] = count / (time.perf_counter() - start)
+    return results
+
+def Timed(function, repeat=1):
+    '''Returns the median number of seconds a call to function takes over repeat calls'''
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+# Searches timed by DatabaseBenchmark, one of each kind of pattern
+SEARCHES = {'prefix': 'smi',
+            'two words': 'jam smi',
+            'phone digits': '813',
+            'email domain': 'gmail',
+            'wildcard': '%son%',
+            'no match': 'qqxzy'}
+
+def DatabaseBenchmark(count, seed=0, repeat=3):
+    '''Times the DatabaseInterface operations on a book of count synthetic contacts, in a fresh contacts.db
+    of a temporary directory. Returns {operation: seconds}.'''
+    rows = SyntheticContacts(count, seed)
+    generator = random.Random(seed)
+    results = {}
+
+    def AddSingle(db, rows):
+        for row in rows:
+            db.AddContact(Contact(*row))
+        db.Commit()
+
+    def EditEach(db, ids):
+        for contactId in ids:
+            db.EditContact(contactId, Contact('Edited{}'.format(contactId), 'Contact', '', '', ('', '', '', '')))
+        db.Commit()
+
+    def DeleteEach(db, ids):
+        for contactId in ids:
+            db.DeleteContact(contactId)
+        db.Commit()
+
+    def Cold(read):
+        # a new interface starts with an empty contact cache, so every contact read is hydrated
+        with DatabaseInterface('benchmark') as db:
+            return read(db)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            with DatabaseInterface('benchmark') as db:
+                db.RegisterCurrentUser('benchmark')
+                db.Commit()
+                single = rows[:min(1000, count // 10)]
+                results['AddContact x{}'.format(len(single))] = Timed(lambda: AddSingle(db, single))
+                with db.BulkLoad():
+                    results['AddContacts bulk x{}'.format(count - len(single))] = Timed(
+                        lambda: db.AddContacts(rows[len(single):]))
+            results['Contacts'] = Timed(lambda: Cold(lambda db: db.Contacts))
+            contacts = Cold(lambda db: db.Contacts)
+            results['sorted(Contacts)'] = Timed(lambda: sorted(contacts), repeat)
+            del contacts
+            results['IterContacts ordered'] = Timed(
+                lambda: Cold(lambda db: sum(1 for contact in db.IterContacts(ordered=True))), repeat)
+            results['ContactsPage first'] = Timed(lambda: Cold(lambda db: db.ContactsPage(limit=200)), repeat)
+            results['ContactsWindow middle'] = Timed(lambda: Cold(lambda db: db.ContactsWindow(count // 2, 200)),
+                                                     repeat)
+            for kind, searchStr in SEARCHES.items():
+                results['Search {}'.format(kind)] = Timed(lambda: Cold(lambda db: db.Search(searchStr)), repeat)
+                results['SearchPage {}'.format(kind)] = Timed(lambda: Cold(lambda db: db.SearchPage(searchStr)),
+                                                              repeat)
+            with DatabaseInterface('benchmark') as db:
+                ids = [contact.id for contact in db.IterContacts()]
+                edited = generator.sample(ids, min(1000, count))
+                results['EditContact x{}'.format(len(edited))] = Timed(lambda: EditEach(db, edited))
+                deleted = generator.sample(ids, min(1000, count))
+                results['DeleteContact x{}'.format(len(deleted))] = Timed(lambda: DeleteEach(db, deleted))
+        finally:
+            ConnectionPool.For(os.path.join(directory, 'contacts.db')).Close()
+            os.chdir(cwd)
+    hydrated = rows[:min(count, 100000)]
+    results['Contact() x{}'.format(len(hydrated))] = Timed(lambda: [Contact(*row) for row in hydrated], repeat)
+    results['Contact.FromRow x{}'.format(len(hydrated))] = Timed(lambda: [Contact.FromRow(*row) for row in hydrated],
+                                                                 repeat)
+    return results
+
+# Name under which RunSuite keeps the results of ContactBenchmark, next to those of each size
+CONTACT_SUITE = 'Contact'
+
+def RunSuite(sizes, seed=0):
+    '''Returns the results of DatabaseBenchmark for each named size and those of ContactBenchmark,
+    along with what they were measured on'''
+    results = {size: DatabaseBenchmark(SIZES[size], seed) for size in sizes}
+    results[CONTACT_SUITE] = ContactBenchmark()
+    return {'meta': {'seed': seed,
+                     'python': platform.python_version(),
+                     'sqlite': sqlite3.sqlite_version,
+                     'platform': platform.platform()},
+            'results': results}
+
+def Rate(operation):
+    '''Whether the result of operation is a rate, where higher is better'''
+    return operation.endswith('/s')
+
+def Unit(operation):
+    '''The unit printed after the result of operation, which names its own unless it is in seconds'''
+    return '' if Rate(operation) or operation.startswith('bytes') else 's'
+
+def Compare(baseline, current, threshold=0.2):
+    '''Returns the (size, operation, baseline result, current result) of the operations of current that got
+    worse than in baseline by more than threshold (a fraction): took that much longer or more bytes, or for a rate,
+    dropped so that the baseline is that much higher'''
+    regressions = []
+    for size, results in current['results'].items():
+        for operation, value in results.items():
+            before = baseline['results'].get(size, {}).get(operation)
+            if before is None:
+                continue
+            if before > value * (1 + threshold) if Rate(operation) else value > before * (1 + threshold):
+                regressions.append((size, operation, before, value))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the address book on synthetic contacts')
+    parser.add_argument('--sizes', default=','.join(SIZES), help='comma separated, among ' + ', '.join(SIZES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown flagged as a regression, 0.2 is 20%%')
+    arguments = parser.parse_args(argv)
+    sizes = [size for size in arguments.sizes.split(',') if size]
+    for size in sizes:
+        if size not in SIZES:
+            parser.error('unknown size {!r}'.format(size))
+    current = RunSuite(sizes, arguments.seed)
+    for size, results in current['results'].items():
+        print(size)
+        for operation, value in results.items():
+            print('  {:<32} {:>10.4f} {}'.format(operation, value, Unit(operation)).rstrip())
+    if arguments.output:
+        with open(arguments.output, 'w') as out:
+            json.dump(current, out, indent=2)
+    if arguments.compare:
+        with open(arguments.compare) as baseline:
+            regressions = Compare(json.load(baseline), current, arguments.threshold)
+        for size, operation, before, value in regressions:
+            print('REGRESSION {} {}: {:.4f} {unit} -> {:.4f} {unit} ({:+.0%})'.format(size, operation, before, value,
+                                                                                    value / before - 1,
+                                                                                    unit=Unit(operation)))
+        if regressions:
+            return 1
+        print('No regressions against {}'.format(arguments.compare))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+# Duplicate detection and merging for the contacts of a user
+# Contacts are grouped into blocks by keys that duplicates are likely to share: phone number, e-mail address and
+# the sound of the last name. Only the pairs within a block are compared, so the work grows with the size of the
+# blocks rather than with the square of the size of the book.
+# python ./Dedup.py <username> [--threshold 0.6] [--merge]
+import argparse
+import itertools
+import sys
+from collections import namedtuple
+
+from AddressBook import Contact, DatabaseInterface, Levenshtein, NormalizePhone
+
+# A group of contacts found to be one person: keep is the id of the contact to keep, with the fields of merged
+# (the eight DatabaseInterface.KEYS values), and duplicates the ids of the contacts merged into it.
+# score is the lowest score of the pairs that joined the group.
+MergeProposal = namedtuple('MergeProposal', ['keep', 'duplicates', 'score', 'merged'])
+
+# Soundex digit of each consonant; vowels, h, w and y have none
+SOUNDEX_CODES = {}
+for letters, digit in (('bfpv', '1'), ('cgjkqsxz', '2'), ('dt', '3'), ('l', '4'), ('mn', '5'), ('r', '6')):
+    for letter in letters:
+        SOUNDEX_CODES[letter] = digit
+
+def Soundex(name):
+    '''Returns the American Soundex code of name, e.g. R163 for both Robert and Rupert, '' if it has no letters'''
+    letters = [letter for letter in str(name).lower() if 'a' <= letter <= 'z']
+    if not letters:
+        return ''
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], '')
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # h and w do not separate two letters with the same code, vowels do
+        if letter not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+def ContactValues(contact):
+    '''Returns the eight DatabaseInterface.KEYS values of contact, '' for a missing one: NULL, empty,
+    or the text 'None' that older versions stored for a missing value'''
+    return tuple('' if field is None or str(field).strip().lower() in ('', 'none') else str(field)
+                 for field in contact.Fields())
+
+# the kinds of blocking keys, in the order of the MatchFields they are made from
+BLOCK_KINDS = ('phone', 'email', 'name')
+
+def MatchFields(values):
+    '''Returns what the contact with the eight values is matched on: its normalized phone, lower cased e-mail
+    and lower cased full name'''
+    return (NormalizePhone(values[2]), values[3].strip().lower(), '{} {}'.format(values[0], values[1]).lower())
+
+def BlockingKeys(values):
+    '''Returns the blocking keys of the contact with the eight values: normalized phone, lower cased e-mail,
+    and the Soundex of the last name with the first initial'''
+    keys = []
+    phone, email, name = MatchFields(values)
+    if phone:
+        keys.append((BLOCK_KINDS[0], phone))
+    if email:
+        keys.append((BLOCK_KINDS[1], email))
+    soundex = Soundex(values[1])
+    if soundex:
+        keys.append((BLOCK_KINDS[2], soundex + values[0][:1].lower()))
+    return keys
+
+def PairScore(a, b, threshold=0.0):
+    '''Returns how likely, from 0 to 1, the contacts with the MatchFields a and b are the same person.
+    The same phone or e-mail count for 0.45 each, different ones against by 0.3 each, and the similarity
+    of the names, 1 minus their edit distance over the length of the longer, for up to 0.7.
+    A pair that cannot reach threshold scores 0 without comparing the names.'''
+    score = 0.0
+    for first, second in zip(a[:2], b[:2]):
+        if first and second:
+            score += 0.45 if first == second else -0.3
+    if score + 0.7 < threshold:
+        return 0.0
+    score += 0.7 * (1 - Levenshtein(a[2], b[2]) / max(len(a[2]), len(b[2]), 1))
+    return max(0.0, min(score, 1.0))
+
+class UnionFind:
+    '''Disjoint sets of ids, joined by Union'''
+    def __init__(self):
+        self.parents = {}
+
+    def Find(self, item):
+        root = item
+        while self.parents.get(root, root) != root:
+            root = self.parents[root]
+        # point every item of the path straight at the root
+        while item != root:
+            self.parents[item], item = root, self.parents.get(item, item)
+        return root
+
+    def Union(self, a, b):
+        a, b = self.Find(a), self.Find(b)
+        if a != b:
+            self.parents[max(a, b)] = min(a, b)
+
+    def Groups(self):
+        '''Returns the sets of more than one id'''
+        groups = {}
+        for item in list(self.parents):
+            groups.setdefault(self.Find(item), set()).add(item)
+        for root, group in groups.items():
+            group.add(root)
+        return list(groups.values())
+
+def MergedValues(values):
+    '''Returns the values of the contact to keep out of the values of a group: the fullest contact,
+    its empty fields filled from the others in order. values is a list of (id, eight values).'''
+    ranked = sorted(values, key=lambda item: (-sum(1 for field in item[1] if field), item[0]))
+    keep, merged = ranked[0][0], list(ranked[0][1])
+    # the address is taken as a whole, from the first contact that has one
+    if not any(merged[4:]):
+        for contactId, fields in ranked[1:]:
+            if any(fields[4:]):
+                merged[4:] = fields[4:]
+                break
+    for index in (2, 3):
+        if not merged[index]:
+            merged[index] = next((fields[index] for contactId, fields in ranked[1:] if fields[index]), '')
+    return keep, tuple(merged)
+
+def FindDuplicates(db, threshold=0.6, maxBlockSize=200):
+    '''Returns the MergeProposals for the contacts of the connected DatabaseInterface db, most likely first.
+    Blocks of more than maxBlockSize contacts are too common a key to tell anything and are skipped.'''
+    values = {}
+    fields = {}
+    blocks = {}
+    for contact in db.IterContacts():
+        values[contact.id] = ContactValues(contact)
+        fields[contact.id] = MatchFields(values[contact.id])
+        for key in BlockingKeys(values[contact.id]):
+            blocks.setdefault(key, []).append(contact.id)
+    groups = UnionFind()
+    matches = []
+    def Compared(kind, value):
+        # whether the pairs of the block of kind with value were scored, it is neither too small nor too large
+        return 2 <= len(blocks.get((BLOCK_KINDS[kind], value), ())) <= maxBlockSize
+    for key, ids in blocks.items():
+        if len(ids) < 2 or len(ids) > maxBlockSize:
+            continue
+        # a pair sharing several keys is only scored in the block of the first that was compared:
+        # phone, e-mail, then name
+        earlier = BLOCK_KINDS.index(key[0])
+        for a, b in itertools.combinations(ids, 2):
+            if any(fields[a][kind] and fields[a][kind] == fields[b][kind] and Compared(kind, fields[a][kind])
+                   for kind in range(earlier)):
+                continue
+            score = PairScore(fields[a], fields[b], threshold)
+            if score >= threshold:
+                groups.Union(a, b)
+                matches.append((a, score))
+    scores = {}
+    for contactId, score in matches:
+        root = groups.Find(contactId)
+        scores[root] = min(score, scores.get(root, score))
+    proposals = []
+    for group in groups.Groups():
+        keep, merged = MergedValues([(contactId, values[contactId]) for contactId in group])
+        proposals.append(MergeProposal(keep, sorted(group - {keep}), scores[groups.Find(keep)], merged))
+    proposals.sort(key=lambda proposal: (-proposal.score, proposal.keep))
+    return proposals
+
+def MergeContacts(db, proposals):
+    '''Applies proposals to the connected DatabaseInterface db in a single transaction: the duplicates are deleted
+    and the kept contacts get their merged fields. Either every proposal is applied or, on error, none.
+    Returns the number of contacts deleted.'''
+    deleted = 0
+    db.Commit()
+    try:
+        for proposal in proposals:
+            for contactId in proposal.duplicates:
+                db.DeleteContact(contactId)
+                deleted += 1
+            merged = proposal.merged
+            db.EditContact(proposal.keep, Contact.FromRow(merged[0], merged[1], merged[2], merged[3], merged[4:]))
+        db.Commit()
+    except BaseException:
+        db.Rollback()
+        raise
+    return deleted
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Find, and optionally merge, duplicate contacts of a user')
+    parser.add_argument('username')
+    parser.add_argument('--threshold', type=float, default=0.6, help='lowest pair score proposed for a merge')
+    parser.add_argument('--max-block', type=int, default=200, help='largest block of candidates compared')
+    parser.add_argument('--merge', action='store_true', help='apply every proposal')
+    arguments = parser.parse_args(argv)
+    with DatabaseInterface(arguments.username) as db:
+        proposals = FindDuplicates(db, arguments.threshold, arguments.max_block)
+        for proposal in proposals:
+            print('{:.2f} keep {} {} merging {}'.format(proposal.score, proposal.keep, ' '.join(proposal.merged[:2]),
+                                                        ', '.join(map(str, proposal.duplicates))))
+        print('{} merge proposals'.format(len(proposals)))
+        if arguments.merge and proposals:
+            print('Merged {} contacts'.format(MergeContacts(db, proposals)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
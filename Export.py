@@ -0,0 +1,108 @@
+# Streaming exporters for the contacts of a user
+# Each exporter writes contacts as they come out of an iterable such as DatabaseInterface.IterContacts(),
+# so exporting a book of any size uses the same memory.
+# python ./Export.py <username> <csv|vcard|jsonl> [output file]
+import csv
+import json
+import sys
+
+from AddressBook import DatabaseInterface
+
+# Column names written by the exporters
+FIELDS = [DatabaseInterface.KEYS.Id] + list(DatabaseInterface.KEYS())
+
+def PhoneText(phone):
+    '''Returns phone as text: the int affinity of the Phone column reads a 10 digit number back as an int,
+    whose leading zeros are put back the same way as in DatabaseInterface.PHONE_DIGITS'''
+    if phone is None:
+        return ''
+    if isinstance(phone, int):
+        return '{:010d}'.format(phone)
+    return str(phone)
+
+def ContactFields(contact):
+    '''Returns the exported fields of contact as a dict keyed by FIELDS, None for a missing one.
+    The phone is always text, '' when missing.'''
+    fields = dict(zip(DatabaseInterface.KEYS(), contact.Fields()))
+    fields[DatabaseInterface.KEYS.Id] = contact.id
+    fields[DatabaseInterface.KEYS.Phone] = PhoneText(fields[DatabaseInterface.KEYS.Phone])
+    return {key: fields[key] for key in FIELDS}
+
+def ExportCSV(contacts, out):
+    '''Writes contacts to the text file out as CSV with a header row. Returns the number of contacts written.'''
+    writer = csv.DictWriter(out, fieldnames=FIELDS)
+    writer.writeheader()
+    count = 0
+    for contact in contacts:
+        writer.writerow(ContactFields(contact))
+        count += 1
+    return count
+
+def ExportJSONL(contacts, out):
+    '''Writes contacts to the text file out as JSON Lines, one object per contact. Returns the number written.'''
+    count = 0
+    for contact in contacts:
+        out.write(json.dumps(ContactFields(contact), ensure_ascii=False))
+        out.write('\n')
+        count += 1
+    return count
+
+def ExportVCard(contacts, out):
+    '''Writes contacts to the text file out as vCard 4.0 (RFC 6350) cards. Returns the number written.'''
+    count = 0
+    for contact in contacts:
+        fields = ContactFields(contact)
+        lines = ['BEGIN:VCARD',
+                 'VERSION:4.0',
+                 'FN:' + _VCardText(contact.name),
+                 'N:{};{};;;'.format(_VCardText(fields[DatabaseInterface.KEYS.LastName]),
+                                     _VCardText(fields[DatabaseInterface.KEYS.FirstName]))]
+        if fields[DatabaseInterface.KEYS.Phone]:
+            lines.append('TEL;VALUE=uri;TYPE=voice:tel:' + fields[DatabaseInterface.KEYS.Phone])
+        if fields[DatabaseInterface.KEYS.Email]:
+            lines.append('EMAIL:' + _VCardText(fields[DatabaseInterface.KEYS.Email]))
+        if any(contact.home):
+            lines.append('ADR:;;{};{};{};{};'.format(*[_VCardText(field) for field in contact.home]))
+        lines.append('END:VCARD')
+        for line in lines:
+            out.write(_VCardFold(line))
+        count += 1
+    return count
+
+def _VCardText(value):
+    # escape a text value, RFC 6350 section 3.4
+    return (str(value if value is not None else '').replace('\\', '\\\\').replace(',', '\\,')
+            .replace(';', '\\;').replace('\r\n', '\\n').replace('\n', '\\n'))
+
+def _VCardFold(line):
+    # content lines are folded at 75 octets, continuation lines start with a space, RFC 6350 section 3.2
+    encoded = line.encode('utf-8')
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        # never cut a multi-byte character in two
+        while encoded[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts) + '\r\n'
+
+EXPORTERS = {'csv': ExportCSV, 'vcard': ExportVCard, 'jsonl': ExportJSONL}
+
+def main(argv):
+    if len(argv) < 3 or argv[2] not in EXPORTERS:
+        print('usage: python ./Export.py <username> <{}> [output file]'.format('|'.join(sorted(EXPORTERS))))
+        return 2
+    out = open(argv[3], 'w', encoding='utf-8', newline='') if len(argv) > 3 else sys.stdout
+    try:
+        with DatabaseInterface(argv[1]) as db:
+            count = EXPORTERS[argv[2]](db.IterContacts(), out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print('Exported {} contacts'.format(count), file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,105 @@
+# Schema migrations for contacts.db
+# Run from the directory that holds contacts.db: python ./Migrations.py [path] [--drop]
+import ast
+import re
+import sqlite3
+import os
+import sys
+
+from AddressBook import DatabaseInterface
+
+# "Street, City, ST 12345", how the single Address column of the oldest layout was usually filled in
+LEGACY_ADDRESS_PATTERN = re.compile(r'\s*(.*?)\s*,\s*(.*?)\s*,\s*([A-Za-z]{2})\s+(\d{5})\s*')
+
+def ContactTables(connection):
+    '''Returns the names of the legacy per-user contact tables in the database, named after their user'''
+    tables = [row[0] for row in connection.execute('''select name from sqlite_master where type='table'
+                                                      and name not in ('Users', 'Contacts', 'MigrationState')
+                                                      and name not like 'sqlite_%'
+                                                      and sql not like 'create virtual table%' ''').fetchall()]
+    return [table for table in tables
+            if DatabaseInterface.KEYS.FirstName in [row[1] for row in connection.execute('pragma table_info({})'
+                                                                                         .format(table)).fetchall()]]
+
+def LegacyAddress(address):
+    '''Returns the (street, city, state, zip) tuple of the free-form Address of the five column layout'''
+    if address is None or address == '':
+        return ('', '', '', '')
+    address = str(address)
+    # some rows hold the str() of a home tuple
+    if address.startswith('('):
+        try:
+            home = ast.literal_eval(address)
+            if isinstance(home, tuple) and len(home) == 4:
+                return tuple('' if field is None else str(field) for field in home)
+        except (ValueError, SyntaxError):
+            pass
+    match = LEGACY_ADDRESS_PATTERN.fullmatch(address)
+    if match:
+        return match.groups()
+    return (address, '', '', '')
+
+def LegacyRows(rows, userId, columns):
+    '''Returns the Contacts rows, UserId first, of rows read from a legacy table with the given columns'''
+    if 'Address' in columns:
+        return [(userId, row[DatabaseInterface.KEYS.FirstName], row[DatabaseInterface.KEYS.LastName],
+                 row[DatabaseInterface.KEYS.Phone], row[DatabaseInterface.KEYS.Email])
+                + LegacyAddress(row['Address']) for row in rows]
+    return [(userId,) + tuple(row[key] for key in DatabaseInterface.KEYS()) for row in rows]
+
+def MigrateToSharedTable(path, batchSize=5000, drop=False):
+    '''Streams the contacts of every per-user table, in either legacy layout, into the shared Contacts table.
+    Each batch of batchSize rows is committed along with the position reached in MigrationState,
+    so an interrupted migration carries on where it stopped when it is run again.
+    Rows whose name is already in the user's contacts are skipped and reported.
+    With drop, a table that was copied without skipping any row is dropped, with its search index.'''
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    try:
+        DatabaseInterface.CreateTables(connection)
+        connection.execute('''create table if not exists MigrationState (TableName text primary key,
+                              LastRowid integer not null default 0, Copied integer not null default 0,
+                              Skipped integer not null default 0, Done integer not null default 0)''')
+        connection.commit()
+        for table in ContactTables(connection):
+            connection.execute('insert or ignore into MigrationState (TableName) values (?)', (table,))
+            state = connection.execute('select * from MigrationState where TableName=?', (table,)).fetchone()
+            if state['Done']:
+                continue
+            user = connection.execute('select Id from Users where username=?', (table,)).fetchone()
+            if user is None:
+                print('{} has no user, registering it without a password'.format(table))
+                userId = connection.execute('insert into Users (username) values (?)', (table,)).lastrowid
+            else:
+                userId = user['Id']
+            columns = [row[1] for row in connection.execute('pragma table_info({})'.format(table)).fetchall()]
+            print('Migrating {}'.format(table))
+            lastRowid, copied, skipped = state['LastRowid'], state['Copied'], state['Skipped']
+            while True:
+                rows = connection.execute('select rowid as LegacyRowid, * from {} where rowid > ? order by rowid limit ?'
+                                          .format(table), (lastRowid, batchSize)).fetchall()
+                if not rows:
+                    break
+                added = connection.executemany(DatabaseInterface.INSERT_CONTACT,
+                                               LegacyRows(rows, userId, columns)).rowcount
+                lastRowid = rows[-1]['LegacyRowid']
+                copied += added
+                skipped += len(rows) - added
+                connection.execute('update MigrationState set LastRowid=?, Copied=?, Skipped=? where TableName=?',
+                                   (lastRowid, copied, skipped, table))
+                connection.commit()
+            connection.execute('update MigrationState set Done=1 where TableName=?', (table,))
+            print('{}: {} contacts copied, {} skipped as duplicate names'.format(table, copied, skipped))
+            if drop and not skipped:
+                connection.execute('drop table if exists {}_fts'.format(table))
+                connection.execute('drop table {}'.format(table))
+            elif drop:
+                print('Keeping {} for its skipped contacts'.format(table))
+            connection.commit()
+    finally:
+        connection.close()
+
+if __name__ == '__main__':
+    arguments = [argument for argument in sys.argv[1:] if argument != '--drop']
+    path = arguments[0] if arguments else os.path.join(os.getcwd(), 'contacts.db')
+    MigrateToSharedTable(path, drop='--drop' in sys.argv[1:])
@@ -0,0 +1,47 @@
+# Query latency report of the address book
+# Runs the queries of the contact list of a user with Instrumentation started and prints what it recorded.
+# python ./QueryStats.py <username> [search ...] [--slow-ms 50] [--json]
+import argparse
+import json
+import logging
+import sys
+
+from AddressBook import DatabaseInterface, Instrumentation
+
+# Searches run when none are given
+SEARCHES = ['a', 'mas', '813', '%son%']
+
+def Workload(db, searches, pages=5):
+    '''The queries the main page makes: count, first pages of the list, a full ordered pass, and searches'''
+    db.ContactCount
+    contacts, cursor = db.ContactsPage()
+    for i in range(pages - 1):
+        if cursor is None:
+            break
+        contacts, cursor = db.ContactsPage(cursor)
+    for contact in db.IterContacts(ordered=True):
+        pass
+    for searchStr in searches:
+        db.Search(searchStr)
+        db.SearchPage(searchStr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the contact list queries of a user')
+    parser.add_argument('username')
+    parser.add_argument('searches', nargs='*', default=SEARCHES)
+    parser.add_argument('--slow-ms', type=float, default=50, help='log the statements slower than this')
+    parser.add_argument('--json', action='store_true', help='print the raw statistics as JSON')
+    arguments = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    with Instrumentation(slowThreshold=arguments.slow_ms / 1000) as instrumentation:
+        with DatabaseInterface(arguments.username) as db:
+            Workload(db, arguments.searches)
+    if arguments.json:
+        json.dump(instrumentation.Dump(), sys.stdout, indent=2)
+        print()
+    else:
+        print(instrumentation.Report())
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+# Headless HTTP/JSON service for the address book
+# python ./Server.py [--host 127.0.0.1] [--port 8080] [--workers 16] [--max-connections 64]
+#
+# POST   /login            {"username": ..., "password": ...}  -> {"token": ...}
+# POST   /logout
+# GET    /contacts         ?limit=200&after=<cursor>            -> {"contacts": [...], "cursor": ...}
+# GET    /search           ?q=...&limit=200&after=<cursor>      -> {"contacts": [...], "cursor": ...}
+# POST   /contacts         contact fields                      -> {"Id": ...}
+# PUT    /contacts/<id>    contact fields
+# DELETE /contacts/<id>
+# Every request but /login carries "Authorization: Bearer <token>". Contacts are objects keyed by
+# Export.FIELDS; cursor is the JSON of the cursor of the last page, to pass back as after.
+import argparse
+import json
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from AddressBook import (Contact, DatabaseInterface, ContactAlreadyExistsException, UserNotFoundException,
+                         InvalidContactPhoneException, InvalidContactEmailException, InvalidContactAddressException)
+from Export import ContactFields
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class Sessions:
+    '''Login tokens and the user each one belongs to'''
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__users = {}
+
+    def Login(self, username):
+        token = secrets.token_urlsafe(32)
+        with self.__lock:
+            self.__users[token] = username
+        return token
+
+    def Logout(self, token):
+        with self.__lock:
+            self.__users.pop(token, None)
+
+    def User(self, token):
+        with self.__lock:
+            return self.__users.get(token)
+
+class ThreadPoolHTTPServer(HTTPServer):
+    '''HTTPServer serving each connection on a thread of a pool of worker threads.
+    Connections beyond maxConnections are answered 503 right away instead of waiting for a worker.'''
+    def __init__(self, address, handler, workers=16, maxConnections=64):
+        super().__init__(address, handler)
+        self.sessions = Sessions()
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Server')
+        self.__connections = threading.BoundedSemaphore(maxConnections)
+
+    def process_request(self, request, client_address):
+        if not self.__connections.acquire(blocking=False):
+            try:
+                request.sendall(b'HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        self.__executor.submit(self.__serve, request, client_address)
+
+    def __serve(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.__connections.release()
+
+    def server_close(self):
+        super().server_close()
+        self.__executor.shutdown(wait=False)
+
+class AddressBookHandler(BaseHTTPRequestHandler):
+    '''JSON endpoints over DatabaseInterface, see the top of Server.py'''
+    # keep-alive: connections serve several requests, idle ones are closed after timeout seconds
+    protocol_version = 'HTTP/1.1'
+    timeout = 15
+    # largest request body accepted, in bytes
+    maxBody = 1 << 20
+
+    def do_GET(self):
+        self.__dispatch()
+
+    def do_POST(self):
+        self.__dispatch()
+
+    def do_PUT(self):
+        self.__dispatch()
+
+    def do_DELETE(self):
+        self.__dispatch()
+
+    def log_message(self, format, *args):
+        pass
+
+    def __dispatch(self):
+        try:
+            url = urlsplit(self.path)
+            self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            parts = [part for part in url.path.split('/') if part]
+            body = self.__body()
+            if parts == ['login'] and self.command == 'POST':
+                return self.__send(HTTPStatus.OK, self.__login(body))
+            user = self.__user()
+            if parts == ['logout'] and self.command == 'POST':
+                self.server.sessions.Logout(self.__token())
+                return self.__send(HTTPStatus.NO_CONTENT)
+            with DatabaseInterface(user) as db:
+                if parts == ['contacts'] and self.command == 'GET':
+                    return self.__send(HTTPStatus.OK, self.__page(*db.ContactsPage(self.__after(), self.__limit())))
+                if parts == ['search'] and self.command == 'GET':
+                    return self.__send(HTTPStatus.OK, self.__page(*db.SearchPage(self.query.get('q', ''),
+                                                                                 self.__after(), self.__limit())))
+                if parts == ['contacts'] and self.command == 'POST':
+                    contactId = db.AddContact(self.__contact(body))
+                    if contactId is None:
+                        raise HTTPError(HTTPStatus.CONFLICT, 'Contact already exists')
+                    return self.__send(HTTPStatus.CREATED, {DatabaseInterface.KEYS.Id: contactId})
+                if len(parts) == 2 and parts[0] == 'contacts' and self.command in ('PUT', 'DELETE'):
+                    contactId = self.__int(parts[1])
+                    if db.GetContact(contactId) is None:
+                        raise HTTPError(HTTPStatus.NOT_FOUND, 'No such contact')
+                    if self.command == 'DELETE':
+                        db.DeleteContact(contactId)
+                        return self.__send(HTTPStatus.NO_CONTENT)
+                    try:
+                        db.EditContact(contactId, self.__contact(body))
+                    except ContactAlreadyExistsException:
+                        raise HTTPError(HTTPStatus.CONFLICT, 'Contact already exists')
+                    return self.__send(HTTPStatus.NO_CONTENT)
+            raise HTTPError(HTTPStatus.NOT_FOUND, 'No such endpoint')
+        except HTTPError as error:
+            self.__send(error.status, {'error': str(error)})
+        except UserNotFoundException:
+            self.__send(HTTPStatus.UNAUTHORIZED, {'error': 'User not found'})
+        except Exception:
+            # a bug must not drop the connection without an answer
+            self.close_connection = True
+            self.__send(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'Internal server error'})
+
+    def __login(self, body):
+        # a new token for the user named in body, if the password in body matches
+        username = str(body.get('username', ''))
+        with DatabaseInterface(username) as db:
+            if not username or not db.CheckPassword(body.get('password')):
+                raise HTTPError(HTTPStatus.UNAUTHORIZED, 'Incorrect username or password')
+        return {'token': self.server.sessions.Login(username)}
+
+    def __body(self):
+        # the JSON object sent with the request, {} if there is none
+        length = self.__int(self.headers.get('Content-Length', 0))
+        if length > self.maxBody:
+            self.close_connection = True
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Request body too large')
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Request body is not JSON')
+        if not isinstance(body, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Request body is not a JSON object')
+        return body
+
+    def __token(self):
+        authorization = self.headers.get('Authorization', '')
+        return authorization[len('Bearer '):] if authorization.startswith('Bearer ') else None
+
+    def __user(self):
+        user = self.server.sessions.User(self.__token())
+        if user is None:
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, 'Log in first')
+        return user
+
+    def __int(self, value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, '{!r} is not a number'.format(value))
+
+    def __limit(self):
+        return max(1, min(self.__int(self.query.get('limit', 200)), 1000))
+
+    def __after(self):
+        if 'after' not in self.query:
+            return None
+        try:
+            key, contactId = json.loads(self.query['after'])
+            return (str(key), int(contactId))
+        except (TypeError, ValueError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Invalid cursor')
+
+    def __contact(self, body):
+        # a Contact made from the fields of body, named as in Export.FIELDS, each a string or null
+        for key in DatabaseInterface.KEYS():
+            if not isinstance(body.get(key), (str, type(None))):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, '{} is not a string'.format(key))
+        fields = {key: body.get(key) or '' for key in DatabaseInterface.KEYS()}
+        try:
+            return Contact(fields[DatabaseInterface.KEYS.FirstName], fields[DatabaseInterface.KEYS.LastName],
+                           fields[DatabaseInterface.KEYS.Phone], fields[DatabaseInterface.KEYS.Email],
+                           (fields[DatabaseInterface.KEYS.Street], fields[DatabaseInterface.KEYS.City],
+                            fields[DatabaseInterface.KEYS.State], fields[DatabaseInterface.KEYS.Zip]))
+        except InvalidContactPhoneException:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Invalid phone number')
+        except InvalidContactEmailException:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Invalid e-mail address')
+        except InvalidContactAddressException:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Invalid address')
+
+    def __page(self, contacts, cursor):
+        return {'contacts': [ContactFields(contact) for contact in contacts], 'cursor': cursor}
+
+    def __send(self, status, body=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        if data:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the address book in contacts.db as JSON over HTTP')
+    # loopback only unless asked otherwise
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=16, help='connections served at the same time')
+    parser.add_argument('--max-connections', type=int, default=64, help='connections accepted before answering 503')
+    arguments = parser.parse_args(argv)
+    server = ThreadPoolHTTPServer((arguments.host, arguments.port), AddressBookHandler,
+                                  arguments.workers, arguments.max_connections)
+    print('Serving on http://{}:{}'.format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+# Read-only columnar snapshots of the contacts of a user
+# A snapshot file holds the contacts in name order, one column at a time: the ids as an array of int64, and every
+# text column as an array of uint32 offsets into a heap of UTF-8 strings, string i being heap[offsets[i]:offsets[i+1]].
+# Snapshot maps the file and reads it in place, so opening one costs the same for a million contacts as for ten,
+# and only the pages actually read are ever loaded.
+# python ./Snapshot.py write <username> <target>
+# python ./Snapshot.py show <snapshot> [--start 0] [--count 20]
+#
+# Layout, little-endian, every section starting on a multiple of 8 bytes:
+#   header     HEADER: magic, format version, number of text columns, number of rows, DataVersion when written
+#   directory  start of the ids, then (offsets start, heap start, heap length) of each text column in COLUMNS order
+#   sections   ids, then the offsets and the heap of each text column
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from AddressBook import Contact, DatabaseInterface
+from Export import ContactFields
+
+MAGIC = b'ABOOKSNP'
+# written into every snapshot, a reader only opens the versions it knows
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQ')
+COLUMN = struct.Struct('<QQQ')
+# the text columns, every contact field; the phone is stored as text
+COLUMNS = list(DatabaseInterface.KEYS())
+
+class InvalidSnapshotException(Exception):
+    pass
+
+def _Aligned(position):
+    return (position + 7) // 8 * 8
+
+def _LittleEndian(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+def WriteSnapshot(db, path):
+    '''Writes the contacts of the connected DatabaseInterface db to a snapshot at path, in name order.
+    The contacts are streamed, memory use is the size of the snapshot. A column holding 4 GiB of text or more
+    does not fit the uint32 offsets and raises OverflowError. Returns the number of contacts written.'''
+    dataVersion = db.DataVersion
+    ids = array('q')
+    offsets = [array('I', [0]) for column in COLUMNS]
+    heaps = [bytearray() for column in COLUMNS]
+    for contact in db.IterContacts(ordered=True):
+        fields = ContactFields(contact)
+        ids.append(fields[DatabaseInterface.KEYS.Id])
+        for column, name in enumerate(COLUMNS):
+            value = fields[name]
+            heaps[column] += ('' if value is None else str(value)).encode('utf-8')
+            offsets[column].append(len(heaps[column]))
+    # lay the sections out after the header and the directory
+    position = _Aligned(HEADER.size + 8 + COLUMN.size * len(COLUMNS))
+    idsStart = position
+    position = _Aligned(position + len(ids) * ids.itemsize)
+    directory = []
+    for column in range(len(COLUMNS)):
+        offsetsStart = position
+        heapStart = _Aligned(offsetsStart + len(offsets[column]) * offsets[column].itemsize)
+        directory.append((offsetsStart, heapStart, len(heaps[column])))
+        position = _Aligned(heapStart + len(heaps[column]))
+    with open(path + '.part', 'wb') as output:
+        def Section(start, data):
+            output.write(b'\0' * (start - output.tell()))
+            output.write(data)
+        output.write(HEADER.pack(MAGIC, VERSION, len(COLUMNS), len(ids), dataVersion))
+        output.write(struct.pack('<Q', idsStart))
+        for entry in directory:
+            output.write(COLUMN.pack(*entry))
+        Section(idsStart, _LittleEndian(ids))
+        for column, (offsetsStart, heapStart, heapLength) in enumerate(directory):
+            Section(offsetsStart, _LittleEndian(offsets[column]))
+            Section(heapStart, heaps[column])
+        output.write(b'\0' * (position - output.tell()))
+    os.replace(path + '.part', path)
+    return len(ids)
+
+class Snapshot:
+    '''A snapshot file mapped read-only, indexed by the position of a contact in name order.
+    Column slices are memoryviews of the mapping, nothing is copied until a value is decoded.
+    It is a data source of VirtualListbox as well: len() and Window(start, stop).
+    Raises InvalidSnapshotException if the file is not a snapshot of a version it reads.'''
+    def __init__(self, path):
+        self.__file = open(path, 'rb')
+        self.__map = None
+        self.__view = None
+        self.__ids = None
+        self.__offsets = {}
+        self.__heaps = {}
+        try:
+            self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, columns, self.rows, self.dataVersion = HEADER.unpack_from(self.__map)
+            if magic != MAGIC or version != VERSION or columns != len(COLUMNS):
+                raise InvalidSnapshotException()
+            self.__view = memoryview(self.__map)
+            idsStart = struct.unpack_from('<Q', self.__map, HEADER.size)[0]
+            self.__ids = self.__section(idsStart, self.rows * 8).cast('q')
+            for column, name in enumerate(COLUMNS):
+                offsetsStart, heapStart, heapLength = COLUMN.unpack_from(self.__map, HEADER.size + 8 + column * COLUMN.size)
+                self.__offsets[name] = self.__section(offsetsStart, (self.rows + 1) * 4).cast('I')
+                self.__heaps[name] = self.__section(heapStart, heapLength)
+        except (InvalidSnapshotException, struct.error, ValueError):
+            # ValueError: an empty file, which cannot be mapped
+            self.Close()
+            raise InvalidSnapshotException()
+
+    def __section(self, start, length):
+        # the length bytes at start, which a truncated file does not have
+        if start + length > len(self.__view):
+            raise InvalidSnapshotException()
+        return self.__view[start:start + length]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.Close()
+
+    def __len__(self):
+        return self.rows
+
+    def Close(self):
+        '''Release the mapping. Slices handed out must be released first.'''
+        for view in list(self.__offsets.values()) + list(self.__heaps.values()) + [self.__ids, self.__view]:
+            if view is not None:
+                view.release()
+        if self.__map is not None:
+            self.__map.close()
+        self.__file.close()
+
+    @property
+    def Ids(self):
+        '''The ids of the contacts, an int64 memoryview'''
+        return self.__ids
+
+    def ColumnSlice(self, column, start, stop):
+        '''Returns (offsets, heap), memoryviews of the rows start to stop-1 of the text column named column:
+        row start + i is heap[offsets[i] - offsets[0]:offsets[i + 1] - offsets[0]] in UTF-8'''
+        start, stop, step = slice(start, stop).indices(self.rows)
+        stop = max(start, stop)
+        offsets = self.__offsets[column][start:stop + 1]
+        return offsets, self.__heaps[column][offsets[0]:offsets[-1]]
+
+    def Bytes(self, column, index):
+        '''The UTF-8 value of column in the index-th row, a memoryview'''
+        offsets = self.__offsets[column]
+        return self.__heaps[column][offsets[index]:offsets[index + 1]]
+
+    def Value(self, column, index):
+        '''The value of column in the index-th row, '' for an empty one'''
+        return str(self.Bytes(column, index), 'utf-8')
+
+    def Contact(self, index):
+        '''The contact in the index-th row'''
+        if not -self.rows <= index < self.rows:
+            raise IndexError(index)
+        index %= self.rows
+        values = [self.Value(column, index) for column in COLUMNS]
+        return Contact.FromRow(values[0], values[1], values[2], values[3], tuple(values[4:]), self.__ids[index])
+
+    def Window(self, start, stop):
+        return [self.Contact(index) for index in range(*slice(start, stop).indices(self.rows))]
+
+    def Apply(self, changes, database):
+        # a snapshot does not change, it has to be written again
+        return False
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write or read a columnar snapshot of the contacts of a user')
+    commands = parser.add_subparsers(dest='command', required=True)
+    command = commands.add_parser('write')
+    command.add_argument('username')
+    command.add_argument('target')
+    command = commands.add_parser('show')
+    command.add_argument('snapshot')
+    command.add_argument('--start', type=int, default=0)
+    command.add_argument('--count', type=int, default=20)
+    arguments = parser.parse_args(argv)
+    if arguments.command == 'write':
+        with DatabaseInterface(arguments.username) as db:
+            print('{} contacts written'.format(WriteSnapshot(db, arguments.target)))
+        return 0
+    with Snapshot(arguments.snapshot) as snapshot:
+        print('{} contacts, data version {}'.format(len(snapshot), snapshot.dataVersion))
+        for contact in snapshot.Window(arguments.start, arguments.start + arguments.count):
+            print('{}\t{}\t{}\t{}'.format(contact.id, contact.name, contact.phone, contact.email))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
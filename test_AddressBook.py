@@ -0,0 +1,111 @@
+# Tests of AddressBook.py, run with: python -m unittest
+# Every test works on a contacts.db of its own in a temporary directory.
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from AddressBook import ChangesCompactedException, ConnectionPool, Contact, DatabaseInterface, QueryWorker
+
+class DatabaseTestCase(unittest.TestCase):
+    '''Runs each test in a temporary working directory, where DatabaseInterface opens its contacts.db'''
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous = os.getcwd()
+        os.chdir(self.directory.name)
+        self.pool = ConnectionPool.For(os.path.join(os.getcwd(), 'contacts.db'))
+
+    def tearDown(self):
+        self.pool.Close()
+        os.chdir(self.previous)
+        self.directory.cleanup()
+
+    def Register(self, username):
+        db = DatabaseInterface(username)
+        db.Connect()
+        db.RegisterCurrentUser('password')
+        db.CloseOut()
+
+class ConnectionPoolTest(DatabaseTestCase):
+    def testConnectCloseOutReturnsConnections(self):
+        self.Register('user')
+        baseline = self.pool.Stats
+        for i in range(20):
+            db = DatabaseInterface('user')
+            db.Connect()
+            self.assertEqual(self.pool.Stats['inUse'], baseline['inUse'] + 1)
+            db.CloseOut()
+            self.assertEqual(self.pool.Stats, baseline)
+
+    def testQueryWorkerCloseReturnsConnection(self):
+        self.Register('user')
+        baseline = self.pool.Stats
+        for i in range(10):
+            worker = QueryWorker('user', debounce=0)
+            worker.Submit(QueryWorker.RELOAD)
+            worker.Submit(QueryWorker.SEARCH, 'name')
+            worker.Close()
+            self.assertEqual(self.pool.Stats, baseline)
+
+    def testIdleConnectionsAreCapped(self):
+        self.Register('user')
+        databases = [DatabaseInterface('user') for i in range(self.pool.size + 3)]
+        for db in databases:
+            db.Connect()
+        for db in databases:
+            db.CloseOut()
+        self.assertEqual(self.pool.Stats, {'open': self.pool.size, 'idle': self.pool.size, 'inUse': 0})
+        self.pool.Close()
+        self.assertEqual(self.pool.Stats, {'open': 0, 'idle': 0, 'inUse': 0})
+
+class ChangeLogTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.Register('user')
+        self.db = DatabaseInterface('user')
+        self.db.Connect()
+
+    def tearDown(self):
+        self.db.CloseOut()
+        super().tearDown()
+
+    def AddContact(self, first, last):
+        contactId = self.db.AddContact(Contact(first, last, '', '', ('', '', '', '')))
+        self.db.Commit()
+        return contactId
+
+    def testChangesSince(self):
+        version = self.db.DataVersion
+        first = self.AddContact('Mary Ann', 'Lee')
+        second = self.AddContact('John', 'Smith')
+        self.db.DeleteContact(first)
+        self.db.Commit()
+        changes = self.db.ChangesSince(version)
+        self.assertEqual([(change.contactId, change.operation) for change in changes],
+                         [(first, 'insert'), (second, 'insert'), (first, 'delete')])
+        self.assertEqual(changes[-1].version, self.db.DataVersion)
+        self.assertEqual(self.db.ChangesSince(self.db.DataVersion), [])
+
+    def testVersionAheadOfTheLog(self):
+        self.AddContact('John', 'Smith')
+        with self.assertRaises(ChangesCompactedException):
+            self.db.ChangesSince(self.db.DataVersion + 1)
+
+    def testVersionAheadAfterRestore(self):
+        # a backup taken before two more changes, copied back over the database
+        backup = sqlite3.connect(':memory:')
+        self.AddContact('John', 'Smith')
+        source = sqlite3.connect('contacts.db')
+        source.backup(backup)
+        self.AddContact('Joan', 'Smith')
+        self.AddContact('Mary Ann', 'Lee')
+        version = self.db.DataVersion
+        backup.backup(source)
+        source.close()
+        backup.close()
+        self.assertLess(self.db.DataVersion, version)
+        with self.assertRaises(ChangesCompactedException):
+            self.db.ChangesSince(version)
+
+if __name__ == '__main__':
+    unittest.main()
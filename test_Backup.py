@@ -0,0 +1,31 @@
+# Tests of Backup.py, run with: python -m unittest
+import unittest
+
+from AddressBook import Contact, DatabaseInterface
+from Backup import Backup, Restore
+from test_AddressBook import DatabaseTestCase
+
+class RestoreTest(DatabaseTestCase):
+    def AddContact(self, db, first, last):
+        db.AddContact(Contact(first, last, '', '', ('', '', '', '')))
+        db.Commit()
+
+    def Names(self, db):
+        return sorted(contact.name for contact in db.Contacts)
+
+    def testLiveInterfaceReadsTheRestoredContacts(self):
+        self.Register('user')
+        with DatabaseInterface('user') as live, DatabaseInterface('user') as other:
+            self.AddContact(live, 'John', 'Smith')
+            Backup('contacts.db', 'backup.db')
+            self.AddContact(live, 'Joan', 'Smith')
+            self.AddContact(live, 'Mary Ann', 'Lee')
+            self.assertEqual(self.Names(live), ['Joan Smith', 'John Smith', 'Mary Ann Lee'])
+            Restore('backup.db', 'contacts.db')
+            # writes after the restore that bring the version back to where live last read it
+            self.AddContact(other, 'Ada', 'Byron')
+            self.AddContact(other, 'Alan', 'Turing')
+            self.assertEqual(self.Names(live), ['Ada Byron', 'Alan Turing', 'John Smith'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+# Tests of Dedup.py, run with: python -m unittest
+import unittest
+
+from AddressBook import DatabaseInterface
+from Dedup import FindDuplicates
+from test_AddressBook import DatabaseTestCase
+
+class FindDuplicatesTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.Register('user')
+        self.db = DatabaseInterface('user')
+        self.db.Connect()
+
+    def tearDown(self):
+        self.db.CloseOut()
+        super().tearDown()
+
+    def testPairInSkippedBlockIsComparedInTheNext(self):
+        # 250 contacts share a placeholder phone, a block too large to compare; the e-mail block finds the pair
+        rows = [('First{}'.format(i), 'Last{}'.format(i), '5550000000', None, (None,) * 4) for i in range(250)]
+        rows += [('Jon', 'Smith', '5550000000', 'smith@example.com', (None,) * 4),
+                 ('John', 'Smith', '5550000000', 'smith@example.com', (None,) * 4)]
+        self.db.AddContacts(rows)
+        self.db.Commit()
+        proposals = FindDuplicates(self.db, maxBlockSize=200)
+        self.assertEqual([(proposal.merged[:2], len(proposal.duplicates)) for proposal in proposals],
+                         [(('Jon', 'Smith'), 1)])
+
+    def testMissingEmailsAreNotShared(self):
+        self.db.AddContacts([('John', 'Smith', None, None, (None,) * 4),
+                             ('Joan', 'Smith', None, None, (None,) * 4)])
+        self.db.Commit()
+        self.assertTrue(all(proposal.score < 0.7 for proposal in FindDuplicates(self.db)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+# Tests of Export.py, run with: python -m unittest
+import csv
+import io
+import json
+import unittest
+
+from AddressBook import Contact, DatabaseInterface
+from Export import ExportCSV, ExportJSONL, ExportVCard
+from test_AddressBook import DatabaseTestCase
+
+class ExportTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.Register('user')
+        self.db = DatabaseInterface('user')
+        self.db.Connect()
+        # the Phone column reads a stored phone back as an int, without its leading zero
+        self.db.AddContact(Contact('Mary Ann', 'Lee', '0123456789', 'mary@example.com',
+                                   ('1 Main St', 'Tampa', 'FL', '33620')))
+        self.db.AddContacts([('John', 'Smith', None, None, (None, None, None, None))])
+        self.db.Commit()
+
+    def tearDown(self):
+        self.db.CloseOut()
+        super().tearDown()
+
+    def Export(self, exporter):
+        out = io.StringIO()
+        self.assertEqual(exporter(self.db.IterContacts(ordered=True), out), 2)
+        return out.getvalue()
+
+    def testCSV(self):
+        rows = list(csv.DictReader(io.StringIO(self.Export(ExportCSV))))
+        self.assertEqual([(row['FirstName'], row['Phone'], row['Email']) for row in rows],
+                         [('Mary Ann', '0123456789', 'mary@example.com'), ('John', '', '')])
+
+    def testJSONL(self):
+        rows = [json.loads(line) for line in self.Export(ExportJSONL).splitlines()]
+        self.assertEqual([(row['FirstName'], row['Phone'], row['Email']) for row in rows],
+                         [('Mary Ann', '0123456789', 'mary@example.com'), ('John', '', None)])
+
+    def testVCard(self):
+        cards = self.Export(ExportVCard).split('END:VCARD\r\n')
+        self.assertIn('TEL;VALUE=uri;TYPE=voice:tel:0123456789\r\n', cards[0])
+        self.assertIn('EMAIL:mary@example.com\r\n', cards[0])
+        self.assertIn('N:Smith;John;;;\r\n', cards[1])
+        self.assertNotIn('TEL', cards[1])
+        self.assertNotIn('EMAIL', cards[1])
+        self.assertNotIn('None', ''.join(cards))
+
+if __name__ == '__main__':
+    unittest.main()